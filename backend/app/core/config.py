@@ -1,9 +1,13 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import Optional
 
 class Settings(BaseSettings):
     mongodb_url: str
     database_name: str
+    mongodb_max_pool_size: int = 100
+    # Negotiated in order; the server picks the first one it also supports
+    mongodb_compressors: str = "zstd,zlib"
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
@@ -18,10 +22,25 @@ class Settings(BaseSettings):
     resend_api_key: Optional[str] = None
     resend_from: str = "onboarding@resend.dev"
 
+    # Repository clones keep full history by default; git metrics and the
+    # survey contributor list are mined from it. Set a depth to cap both on
+    # very large repositories.
+    git_clone_depth: Optional[int] = None
+
+    # On-disk cache of per-file smell detection results, keyed by file
+    # content. Off unless set; nothing evicts entries, so point it at a
+    # directory that is pruned externally (or cleared between deploys).
+    smell_cache_dir: Optional[str] = None
+
     # Public frontend URL (used to build survey links)
     frontend_url: str = "http://localhost:5173"
 
     class Config:
         env_file = ".env"
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Build Settings once per process; .env is parsed on the first call only."""
+    return Settings()
+
+settings = get_settings()
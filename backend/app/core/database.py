@@ -1,10 +1,49 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
 
-client = AsyncIOMotorClient(settings.mongodb_url)
+client = AsyncIOMotorClient(
+    settings.mongodb_url,
+    maxPoolSize=settings.mongodb_max_pool_size,
+    compressors=settings.mongodb_compressors,
+    uuidRepresentation="standard",
+    retryWrites=True,
+    serverSelectionTimeoutMS=5000,
+)
 database = client[settings.database_name]
 users_collection = database.get_collection("users")
 projects_collection = database.get_collection("projects")
 runs_collection = database.get_collection("runs")
+# Full smell_analysis payloads, keyed by run _id, kept out of the hot runs documents
+run_analyses_collection = database.get_collection("run_analyses")
 surveys_collection = database.get_collection("surveys")
 survey_responses_collection = database.get_collection("survey_responses")
+
+
+async def ensure_indexes():
+    """Create the indexes backing the per-user and per-project queries (idempotent)."""
+    await users_collection.create_index("email", unique=True)
+    await projects_collection.create_index([("user_id", 1), ("created_at", -1)])
+    # Also serves the plain {"project_id": ...} counts and deletes via its prefix
+    await runs_collection.create_index([("project_id", 1), ("run_number", -1)])
+    # Pending-run lease renewal and reaping (see routes/projects.py)
+    await runs_collection.create_index([("status", 1), ("heartbeat_at", 1)])
+    await run_analyses_collection.create_index("project_id")
+    await survey_responses_collection.create_index([("survey_id", 1), ("submitted_at", 1)])
+    await survey_responses_collection.create_index("run_id")
+    # Public survey links look surveys up by contributor token
+    await surveys_collection.create_index("contributors.token")
+
+
+async def get_smell_analysis(run_id, run_doc: dict = None):
+    """
+    Load a run's smell_analysis from run_analyses.
+
+    Runs completed before the split still carry it inline; pass the run
+    document when it is already loaded to avoid a second read for those.
+    """
+    doc = await run_analyses_collection.find_one({"_id": run_id}, {"smell_analysis": 1})
+    if doc:
+        return doc.get("smell_analysis")
+    if run_doc is None:
+        run_doc = await runs_collection.find_one({"_id": run_id}, {"smell_analysis": 1})
+    return run_doc.get("smell_analysis") if run_doc else None
@@ -1,29 +1,89 @@
 # app/routes/projects.py
-import os
-import stat
-import shutil
-import subprocess
-from datetime import datetime, timezone
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Optional
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Query
-
-from app.core.database import projects_collection, runs_collection
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from pymongo import ReturnDocument
+
+from app.core.database import (
+    get_smell_analysis,
+    projects_collection,
+    run_analyses_collection,
+    runs_collection,
+)
 from app.core.security import get_current_user
 from app.models.project import ProjectCreate
-from app.services.smell_detection import detect_smells_for_project
+from app.services.repo_clone import clone_repository, get_head_sha
+from app.services.smell_detection import ANALYSIS_VERSION, detect_smells_for_project
+from app.utils.filesystem import directory_lock, move_to_trash, remove_tree
+from app.utils.object_ids import ProjectObjectId, RunObjectId, parse_object_id
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
+logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = Path("uploaded_projects")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 
-def _force_remove(func, path, _excinfo):
-    """Error handler for shutil.rmtree — removes read-only flag on Windows before retrying."""
-    os.chmod(path, stat.S_IWRITE)
-    func(path)
+# Runs execute as background tasks of the process that accepted them. That
+# process stamps its pending runs with its instance id and renews their
+# heartbeat_at; a pending run whose heartbeat is older than the lease
+# belongs to a process that is gone (restart, crash, finished deploy) and
+# will never finish, so any live process marks it failed.
+_INSTANCE_ID = uuid.uuid4().hex
+_RUN_HEARTBEAT_INTERVAL = 30
+_RUN_LEASE = 120
+_heartbeat_task: Optional[asyncio.Task] = None
+
+
+async def _renew_run_leases() -> None:
+    now = datetime.now(timezone.utc)
+    await runs_collection.update_many(
+        {"status": "pending", "owner": _INSTANCE_ID},
+        {"$set": {"heartbeat_at": now}},
+    )
+    cutoff = now - timedelta(seconds=_RUN_LEASE)
+    await runs_collection.update_many(
+        {
+            "status": "pending",
+            "owner": {"$ne": _INSTANCE_ID},
+            "$or": [
+                {"heartbeat_at": {"$lt": cutoff}},
+                # Runs started before leases existed
+                {"heartbeat_at": {"$exists": False}, "created_at": {"$lt": cutoff}},
+            ],
+        },
+        {"$set": {"status": "failed", "error": "Interrupted: the server running it stopped"}},
+    )
+
+
+async def _run_heartbeat() -> None:
+    while True:
+        try:
+            await _renew_run_leases()
+        except Exception as exc:
+            logger.warning("run heartbeat error: %s", exc)
+        await asyncio.sleep(_RUN_HEARTBEAT_INTERVAL)
+
+
+def start_run_heartbeat() -> None:
+    """Start renewing this process's run leases (and reaping abandoned runs)."""
+    global _heartbeat_task
+    if _heartbeat_task is None:
+        _heartbeat_task = asyncio.ensure_future(_run_heartbeat())
+
+
+async def stop_run_heartbeat() -> None:
+    global _heartbeat_task
+    task, _heartbeat_task = _heartbeat_task, None
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
 
 
 def _project_to_dict(doc: dict, run_count: int = 0) -> dict:
@@ -54,6 +114,50 @@ def _run_to_dict(doc: dict, include_analysis: bool = True) -> dict:
     return result
 
 
+async def _ranked_smells(project_oid: ObjectId, run_oids: list) -> dict:
+    """
+    Rank each run's smells by prioritization_score inside MongoDB.
+
+    Returns {run_oid: {smell_type: {"rank": int, "score": float}}}; ties keep
+    the order the smells were stored in, as a stable sort would.
+    """
+    cursor = runs_collection.aggregate([
+        {"$match": {"_id": {"$in": run_oids}, "project_id": project_oid}},
+        {"$lookup": {
+            "from": "run_analyses",
+            "localField": "_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"metrics": "$smell_analysis.git_metrics.metrics"}}],
+            "as": "analysis",
+        }},
+        # Older runs keep smell_analysis inline on the run document
+        {"$project": {"metrics": {"$objectToArray": {
+            "$ifNull": [
+                {"$first": "$analysis.metrics"},
+                "$smell_analysis.git_metrics.metrics",
+                {},
+            ],
+        }}}},
+        {"$unwind": {"path": "$metrics", "includeArrayIndex": "pos"}},
+        {"$project": {
+            "smell": "$metrics.k",
+            "score": {"$ifNull": ["$metrics.v.prioritization_score", 0]},
+            "pos": 1,
+        }},
+        {"$setWindowFields": {
+            "partitionBy": "$_id",
+            "sortBy": {"score": -1, "pos": 1},
+            "output": {"rank": {"$documentNumber": {}}},
+        }},
+        # Rank order per run, so each result dict is built in rank order
+        {"$sort": {"_id": 1, "rank": 1}},
+    ])
+    ranked: dict = {oid: {} for oid in run_oids}
+    async for doc in cursor:
+        ranked[doc["_id"]][doc["smell"]] = {"rank": doc["rank"], "score": doc["score"]}
+    return ranked
+
+
 # ===============================
 # Create a new project
 # ===============================
@@ -71,6 +175,7 @@ async def create_project(
         "name": body.name.strip(),
         "repo_url": repo_url,
         "created_at": datetime.now(timezone.utc),
+        "run_counter": 0,
     }
     result = await projects_collection.insert_one(doc)
     doc["_id"] = result.inserted_id
@@ -85,12 +190,14 @@ async def list_projects(current_user: dict = Depends(get_current_user)):
     cursor = projects_collection.find({"user_id": current_user["_id"]}).sort("created_at", -1)
     projects = await cursor.to_list(length=100)
 
-    result = []
-    for p in projects:
-        project_id = p["_id"]
-        run_count = await runs_collection.count_documents({"project_id": project_id})
-        result.append(_project_to_dict(p, run_count=run_count))
-    return result
+    # One grouped count for all projects instead of a count_documents per project
+    counts_cursor = runs_collection.aggregate([
+        {"$match": {"project_id": {"$in": [p["_id"] for p in projects]}}},
+        {"$group": {"_id": "$project_id", "n": {"$sum": 1}}},
+    ])
+    counts = {doc["_id"]: doc["n"] async for doc in counts_cursor}
+
+    return [_project_to_dict(p, run_count=counts.get(p["_id"], 0)) for p in projects]
 
 
 # ===============================
@@ -98,20 +205,18 @@ async def list_projects(current_user: dict = Depends(get_current_user)):
 # ===============================
 @router.delete("/{project_id}")
 async def delete_project(
-    project_id: str,
+    project_oid: ProjectObjectId,
     current_user: dict = Depends(get_current_user),
 ):
-    try:
-        oid = ObjectId(project_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid project ID")
-
-    project = await projects_collection.find_one({"_id": oid, "user_id": current_user["_id"]})
+    project = await projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    await runs_collection.delete_many({"project_id": oid})
-    await projects_collection.delete_one({"_id": oid})
+    await asyncio.gather(
+        runs_collection.delete_many({"project_id": project_oid}),
+        run_analyses_collection.delete_many({"project_id": project_oid}),
+        projects_collection.delete_one({"_id": project_oid}),
+    )
     return {"message": "Project deleted"}
 
 
@@ -120,80 +225,149 @@ async def delete_project(
 # ===============================
 @router.post("/{project_id}/runs")
 async def trigger_run(
-    project_id: str,
+    project_oid: ProjectObjectId,
+    background_tasks: BackgroundTasks,
+    force: bool = Query(False, description="Re-analyse even if an earlier run covered this commit"),
     current_user: dict = Depends(get_current_user),
 ):
-    try:
-        oid = ObjectId(project_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid project ID")
+    owned = {"_id": project_oid, "user_id": current_user["_id"]}
+
+    # One run at a time per project; the UI keeps the button disabled until
+    # the pending run finishes
+    if await runs_collection.find_one(
+        {"project_id": project_oid, "user_id": current_user["_id"], "status": "pending"},
+        {"_id": 1},
+    ):
+        raise HTTPException(status_code=409, detail="An analysis run is already in progress")
+
+    # Projects created before run_counter existed: seed it from their highest
+    # run number (not the run count, which drops when runs are deleted).
+    # The seed only applies while the field is unset, so concurrent triggers
+    # all $inc from the same base below
+    if not await projects_collection.count_documents({**owned, "run_counter": {"$exists": True}}):
+        last_run = await runs_collection.find_one(
+            {"project_id": project_oid},
+            {"run_number": 1},
+            sort=[("run_number", -1)],
+        )
+        await projects_collection.update_one(
+            {**owned, "run_counter": {"$exists": False}},
+            {"$set": {"run_counter": last_run["run_number"] if last_run else 0}},
+        )
 
-    project = await projects_collection.find_one({"_id": oid, "user_id": current_user["_id"]})
+    # Ownership check and run number allocation in one atomic round-trip
+    project = await projects_collection.find_one_and_update(
+        owned,
+        {"$inc": {"run_counter": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-
-    # Determine run number
-    run_count = await runs_collection.count_documents({"project_id": oid})
-    run_number = run_count + 1
+    run_number = project["run_counter"]
 
     # Insert pending run
     run_doc = {
-        "project_id": oid,
+        "project_id": project_oid,
         "user_id": current_user["_id"],
         "run_number": run_number,
         "created_at": datetime.now(timezone.utc),
         "status": "pending",
         "summary": None,
-        "smell_analysis": None,
         "error": None,
+        "owner": _INSTANCE_ID,
+        "heartbeat_at": datetime.now(timezone.utc),
     }
     run_result = await runs_collection.insert_one(run_doc)
-    run_id = run_result.inserted_id
+    run_doc["_id"] = run_result.inserted_id
 
-    # Clone the repo
-    repo_url = project["repo_url"]
-    repo_name = repo_url.rstrip("/").split("/")[-1].replace(".git", "")
-    user_dir = UPLOAD_DIR / f"user_{str(current_user['_id'])}"
-    user_dir.mkdir(exist_ok=True)
-    project_dir = user_dir / repo_name
-
-    try:
-        if project_dir.exists():
-            shutil.rmtree(project_dir, onerror=_force_remove)
-
-        clone_result = subprocess.run(
-            ["git", "clone", repo_url, str(project_dir)],
-            capture_output=True,
-            text=True,
-            timeout=300,
-        )
-
-        if clone_result.returncode != 0:
-            raise RuntimeError(clone_result.stderr)
-
-        # Run smell detection
-        smell_result = detect_smells_for_project(project_dir)
+    # Clone + detection take minutes; run them after the response is sent
+    background_tasks.add_task(_execute_run, run_doc["_id"], project, current_user["_id"], not force)
 
-        summary = {
-            "total_files": smell_result.get("total_files", 0),
-            "total_smells": smell_result.get("total_smells", 0),
-        }
+    return _run_to_dict(run_doc, include_analysis=True)
 
-        # Update run as completed
-        await runs_collection.update_one(
-            {"_id": run_id},
-            {"$set": {"status": "completed", "smell_analysis": smell_result, "summary": summary}},
-        )
-        run_doc.update({"_id": run_id, "status": "completed", "smell_analysis": smell_result, "summary": summary})
 
-    except Exception as e:
-        await runs_collection.update_one(
-            {"_id": run_id},
-            {"$set": {"status": "failed", "error": str(e)}},
-        )
-        run_doc.update({"_id": run_id, "status": "failed", "error": str(e)})
+async def _execute_run(run_id: ObjectId, project: dict, user_id: ObjectId, reuse: bool = True):
+    """
+    Clone the project's repo, detect smells and record the outcome on the run.
+    With reuse, an earlier completed run of the same commit and analysis
+    version supplies the analysis instead.
+    """
+    repo_url = project["repo_url"]
+    repo_name = repo_url.rstrip("/").split("/")[-1].replace(".git", "")
+    user_dir = UPLOAD_DIR / f"user_{str(user_id)}"
+    project_dir = user_dir / repo_name
 
-    return _run_to_dict(run_doc, include_analysis=True)
+    # Runs of this project (and GitHub uploads of the same repo) share
+    # project_dir; one at a time, or a second clone trashes the first's
+    async with directory_lock(project_dir):
+        cleanup = None
+        try:
+            await asyncio.to_thread(user_dir.mkdir, exist_ok=True)
+            if await asyncio.to_thread(project_dir.exists):
+                # Delete the previous clone while the new one downloads
+                trash = await asyncio.to_thread(move_to_trash, project_dir)
+                cleanup = asyncio.ensure_future(asyncio.to_thread(remove_tree, trash))
+
+            await clone_repository(repo_url, project_dir)
+
+            # Same commit and analysis version as an earlier completed run: reuse its analysis
+            head_sha = await asyncio.to_thread(get_head_sha, project_dir)
+            previous = None
+            smell_result = None
+            if head_sha and reuse:
+                previous = await runs_collection.find_one(
+                    {
+                        "project_id": project["_id"],
+                        "head_sha": head_sha,
+                        "analysis_version": ANALYSIS_VERSION,
+                        "status": "completed",
+                    },
+                    {"_id": 1},
+                    sort=[("run_number", -1)],
+                )
+                if previous:
+                    smell_result = await get_smell_analysis(previous["_id"])
+
+            # Run smell detection
+            if smell_result is None:
+                previous = None
+                smell_result = await asyncio.to_thread(detect_smells_for_project, project_dir)
+
+            summary = {
+                "total_files": smell_result.get("total_files", 0),
+                "total_smells": smell_result.get("total_smells", 0),
+            }
+
+            # Store the analysis before flagging the run completed, so readers
+            # that see "completed" always find it
+            await run_analyses_collection.replace_one(
+                {"_id": run_id},
+                {"project_id": project["_id"], "smell_analysis": smell_result},
+                upsert=True,
+            )
+            # Status guards: a run already failed as abandoned stays failed
+            # (and its now-unreachable analysis is dropped)
+            completed = await runs_collection.update_one(
+                {"_id": run_id, "status": "pending"},
+                {"$set": {
+                    "status": "completed",
+                    "summary": summary,
+                    "head_sha": head_sha,
+                    "analysis_version": ANALYSIS_VERSION,
+                    "cached_from": previous["_id"] if previous else None,
+                }},
+            )
+            if not completed.modified_count:
+                await run_analyses_collection.delete_one({"_id": run_id})
+
+        except Exception as e:
+            await runs_collection.update_one(
+                {"_id": run_id, "status": "pending"},
+                {"$set": {"status": "failed", "error": str(e)}},
+            )
+        finally:
+            if cleanup:
+                await asyncio.gather(cleanup, return_exceptions=True)
 
 
 # ===============================
@@ -201,24 +375,31 @@ async def trigger_run(
 # ===============================
 @router.get("/{project_id}/runs")
 async def list_runs(
-    project_id: str,
+    project_oid: ProjectObjectId,
     current_user: dict = Depends(get_current_user),
 ):
-    try:
-        oid = ObjectId(project_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid project ID")
-
-    project = await projects_collection.find_one({"_id": oid, "user_id": current_user["_id"]})
+    project = await projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    cursor = runs_collection.find(
-        {"project_id": oid},
-        {"smell_analysis": 0},  # exclude heavy field
-    ).sort("run_number", -1)
-    runs = await cursor.to_list(length=200)
-    return [_run_to_dict(r, include_analysis=False) for r in runs]
+    # Shape rows server-side (same fields as _run_to_dict(include_analysis=False))
+    cursor = runs_collection.aggregate([
+        {"$match": {"project_id": project_oid}},
+        {"$sort": {"run_number": -1}},
+        {"$limit": 200},
+        {"$project": {
+            "_id": 0,
+            "id": {"$toString": "$_id"},
+            "project_id": {"$toString": "$project_id"},
+            "run_number": 1,
+            "created_at": 1,
+            "status": 1,
+            "summary": {"$ifNull": ["$summary", None]},
+            "error": {"$ifNull": ["$error", None]},
+            "smell_analysis": {"$literal": None},
+        }},
+    ])
+    return await cursor.to_list(length=200)
 
 
 # ===============================
@@ -226,25 +407,23 @@ async def list_runs(
 # ===============================
 @router.delete("/{project_id}/runs/{run_id}")
 async def delete_run(
-    project_id: str,
-    run_id: str,
+    project_oid: ProjectObjectId,
+    run_oid: RunObjectId,
     current_user: dict = Depends(get_current_user),
 ):
-    try:
-        project_oid = ObjectId(project_id)
-        run_oid = ObjectId(run_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid ID")
-
-    project = await projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]})
+    project, run = await asyncio.gather(
+        projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]}),
+        runs_collection.find_one({"_id": run_oid, "project_id": project_oid}),
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-
-    run = await runs_collection.find_one({"_id": run_oid, "project_id": project_oid})
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
 
-    await runs_collection.delete_one({"_id": run_oid})
+    await asyncio.gather(
+        runs_collection.delete_one({"_id": run_oid}),
+        run_analyses_collection.delete_one({"_id": run_oid}),
+    )
     return {"message": "Run deleted"}
 
 
@@ -253,24 +432,22 @@ async def delete_run(
 # ===============================
 @router.get("/{project_id}/runs/{run_id}")
 async def get_run(
-    project_id: str,
-    run_id: str,
+    project_oid: ProjectObjectId,
+    run_oid: RunObjectId,
     current_user: dict = Depends(get_current_user),
 ):
-    try:
-        project_oid = ObjectId(project_id)
-        run_oid = ObjectId(run_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid ID")
-
-    project = await projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]})
+    project, run, analysis = await asyncio.gather(
+        projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]}),
+        runs_collection.find_one({"_id": run_oid, "project_id": project_oid}),
+        run_analyses_collection.find_one({"_id": run_oid}, {"smell_analysis": 1}),
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-
-    run = await runs_collection.find_one({"_id": run_oid, "project_id": project_oid})
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
 
+    if analysis:
+        run["smell_analysis"] = analysis.get("smell_analysis")
     return _run_to_dict(run, include_analysis=True)
 
 
@@ -279,54 +456,37 @@ async def get_run(
 # ===============================
 @router.get("/{project_id}/compare")
 async def compare_runs(
-    project_id: str,
+    project_oid: ProjectObjectId,
     run1: str = Query(...),
     run2: str = Query(...),
     current_user: dict = Depends(get_current_user),
 ):
-    try:
-        project_oid = ObjectId(project_id)
-        run1_oid = ObjectId(run1)
-        run2_oid = ObjectId(run2)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid ID")
-
-    project = await projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]})
+    run1_oid = parse_object_id(run1, "Invalid run ID")
+    run2_oid = parse_object_id(run2, "Invalid run ID")
+
+    project, run1_doc, run2_doc, ranked = await asyncio.gather(
+        projects_collection.find_one({"_id": project_oid, "user_id": current_user["_id"]}),
+        runs_collection.find_one({"_id": run1_oid, "project_id": project_oid}, {"smell_analysis": 0}),
+        runs_collection.find_one({"_id": run2_oid, "project_id": project_oid}, {"smell_analysis": 0}),
+        _ranked_smells(project_oid, [run1_oid, run2_oid]),
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-
-    run1_doc = await runs_collection.find_one({"_id": run1_oid, "project_id": project_oid})
-    run2_doc = await runs_collection.find_one({"_id": run2_oid, "project_id": project_oid})
-
     if not run1_doc or not run2_doc:
         raise HTTPException(status_code=404, detail="One or both runs not found")
 
-    # Build comparison from git_metrics prioritization scores
-    def get_ranked_smells(run_doc: dict) -> dict:
-        """Returns {smell_type: {rank, score}} sorted by prioritization_score desc"""
-        analysis = run_doc.get("smell_analysis") or {}
-        git_metrics = analysis.get("git_metrics") or {}
-        metrics = git_metrics.get("metrics") or {}
-
-        sorted_smells = sorted(
-            metrics.items(),
-            key=lambda x: x[1].get("prioritization_score", 0),
-            reverse=True,
-        )
-        return {
-            smell: {"rank": idx + 1, "score": data.get("prioritization_score", 0)}
-            for idx, (smell, data) in enumerate(sorted_smells)
-        }
+    # Comparison is built from the git_metrics prioritization scores
+    r1_ranked = ranked[run1_oid]
+    r2_ranked = ranked[run2_oid]
 
-    r1_ranked = get_ranked_smells(run1_doc)
-    r2_ranked = get_ranked_smells(run2_doc)
-
-    all_smells = sorted(set(list(r1_ranked.keys()) + list(r2_ranked.keys())))
+    # Smells present in run1 in rank order, then run2-only smells alphabetically
+    ordered_smells = list(r1_ranked)
+    ordered_smells.extend(sorted(r2_ranked.keys() - r1_ranked.keys()))
 
     comparison = []
     improved = worsened = unchanged = 0
 
-    for smell in all_smells:
+    for smell in ordered_smells:
         r1 = r1_ranked.get(smell)
         r2 = r2_ranked.get(smell)
 
@@ -359,11 +519,8 @@ async def compare_runs(
             "score_change": score_change,
         })
 
-    # Sort by run1 rank (smells that existed in run1 first)
-    comparison.sort(key=lambda x: (x["run1_rank"] is None, x["run1_rank"] or 999))
-
     return {
-        "project_id": project_id,
+        "project_id": str(project_oid),
         "run1": _run_to_dict(run1_doc, include_analysis=False),
         "run2": _run_to_dict(run2_doc, include_analysis=False),
         "comparison": comparison,
@@ -11,64 +11,87 @@ Protected endpoints (Bearer token required):
   GET  /api/projects/{project_id}/runs/{run_id}/survey         — get survey status / results
 """
 
+import asyncio
+import logging
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 from typing import Dict, Optional
 
 from app.core.database import (
+    get_smell_analysis,
     projects_collection,
-    runs_collection,
     surveys_collection,
     survey_responses_collection,
 )
 from app.core.config import settings
 from app.core.security import get_current_user
+from app.services.repo_clone import get_head_sha
+from app.utils.object_ids import ProjectObjectId, RunObjectId
 from app.services.survey_service import (
     SMELL_ORDER,
     SMELL_DESCRIPTIONS,
     ABBR_TO_NAME,
     extract_contributors,
     send_survey_emails,
-    calculate_dds,
+    DDSAccumulator,
     calculate_quadrant_results,
 )
 
 router = APIRouter(tags=["survey"])
+logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = Path("uploaded_projects")
 
+_UTC = timezone.utc
+
+# The survey form's smell prompts are the same for every survey
+_SMELL_PAYLOAD = tuple(
+    {
+        "abbreviation": abbr,
+        "name":         ABBR_TO_NAME.get(abbr, abbr),
+        "description":  SMELL_DESCRIPTIONS.get(abbr, ""),
+    }
+    for abbr in SMELL_ORDER
+)
+
+# Submissions arriving within this window share one DDS/quadrant recompute
+_RESULTS_REFRESH_DELAY = 0.25
+_pending_refreshes: Dict[ObjectId, asyncio.TimerHandle] = {}
+_running_refreshes: set = set()
+
 
 # ── helpers ────────────────────────────────────────────────────────────────────
 
-async def _get_project_and_run(project_id: str, run_id: str, current_user: dict):
-    """Shared guard: verify project belongs to user, fetch run."""
-    try:
-        proj = await projects_collection.find_one({
-            "_id": ObjectId(project_id),
-            "user_id": current_user["_id"],
-        })
-    except Exception:
-        raise HTTPException(status_code=404, detail="Project not found")
+async def _get_project_and_run(project_oid: ObjectId, run_oid: ObjectId, current_user: dict):
+    """Shared guard: verify project belongs to user, fetch run (one round-trip)."""
+    rows = await projects_collection.aggregate([
+        {"$match": {"_id": project_oid, "user_id": current_user["_id"]}},
+        {"$lookup": {
+            "from": "runs",
+            "pipeline": [
+                {"$match": {"_id": run_oid, "project_id": project_oid}},
+                # Legacy runs still carry the full analysis inline; never needed here
+                {"$project": {"smell_analysis": 0}},
+            ],
+            "as": "run",
+        }},
+    ]).to_list(length=1)
 
-    if not proj:
+    if not rows:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    try:
-        run = await runs_collection.find_one({
-            "_id": ObjectId(run_id),
-            "project_id": ObjectId(project_id),
-        })
-    except Exception:
-        raise HTTPException(status_code=404, detail="Run not found")
-
-    if not run:
+    proj = rows[0]
+    runs = proj.pop("run")
+    if not runs:
         raise HTTPException(status_code=404, detail="Run not found")
 
+    run = runs[0]
     if run.get("status") != "completed":
         raise HTTPException(status_code=400, detail="Run is not completed yet")
 
@@ -95,25 +118,109 @@ def _survey_to_dict(doc: dict) -> dict:
         "created_at":       doc.get("created_at"),
         "dds":              doc.get("dds"),
         "quadrant_results": doc.get("quadrant_results"),
+        "email_dispatch":   doc.get("email_dispatch"),
     }
 
 
+async def _dispatch_survey_emails(survey_oid: ObjectId, contributors: list, project_name: str):
+    """Background task: send survey links and record the outcome on the survey."""
+    try:
+        email_result = await send_survey_emails(
+            contributors=contributors,
+            survey_id=str(survey_oid),
+            project_name=project_name,
+            base_url=settings.frontend_url,
+        )
+    except Exception as exc:
+        logger.exception("email dispatch error: %s", exc)
+        email_result = {"sent": 0, "failed": len(contributors)}
+
+    await surveys_collection.update_one(
+        {"_id": survey_oid},
+        {"$set": {"email_dispatch": {"status": "done", **email_result}}},
+    )
+
+
+async def _refresh_survey_results(
+    survey_oid: ObjectId,
+    run_oid: ObjectId,
+    dds_state: Optional[dict] = None,
+) -> Optional[dict]:
+    """
+    Recompute DDS + quadrant results from the survey's running totals
+    (read here unless passed in) and return the stored fields.
+
+    The write only lands while dds_state still holds the response count it
+    was computed from; if a newer response was folded in meanwhile, that
+    submission's own refresh writes instead. dds_responses records the count
+    so readers can tell when results are behind.
+    """
+    try:
+        if dds_state is None:
+            survey = await surveys_collection.find_one({"_id": survey_oid}, {"dds_state": 1})
+            if not survey or "dds_state" not in survey:
+                return None
+            dds_state = survey["dds_state"]
+
+        responses = dds_state.get("responses", 0)
+        new_dds = DDSAccumulator.from_state(dds_state).result()
+
+        new_quadrant = None
+        if new_dds:
+            smell_analysis = await get_smell_analysis(run_oid)
+            if smell_analysis:
+                new_quadrant = calculate_quadrant_results(smell_analysis, new_dds)
+
+        fields = {
+            "dds":              new_dds,
+            "quadrant_results": new_quadrant,
+            "dds_responses":    responses,
+        }
+        await surveys_collection.update_one(
+            {"_id": survey_oid, "dds_state.responses": responses},
+            {"$set": fields},
+        )
+        return fields
+    except Exception as exc:
+        logger.exception("results refresh error: %s", exc)
+        return None
+
+
+def _start_results_refresh(survey_oid: ObjectId, run_oid: ObjectId):
+    _pending_refreshes.pop(survey_oid, None)
+    task = asyncio.ensure_future(_refresh_survey_results(survey_oid, run_oid))
+    # Hold a reference until it finishes so the task isn't garbage-collected
+    _running_refreshes.add(task)
+    task.add_done_callback(_running_refreshes.discard)
+
+
+def _schedule_results_refresh(survey_oid: ObjectId, run_oid: ObjectId):
+    """(Re)arm the debounce timer for a survey's results recompute."""
+    handle = _pending_refreshes.pop(survey_oid, None)
+    if handle:
+        handle.cancel()
+    _pending_refreshes[survey_oid] = asyncio.get_running_loop().call_later(
+        _RESULTS_REFRESH_DELAY, _start_results_refresh, survey_oid, run_oid,
+    )
+
+
 # ── PROTECTED: start survey ────────────────────────────────────────────────────
 
 @router.post("/api/projects/{project_id}/runs/{run_id}/survey/start")
 async def start_survey(
-    project_id: str,
-    run_id: str,
+    project_oid: ProjectObjectId,
+    run_oid: RunObjectId,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
 ):
     """
     1. Find the cloned repo path for this project
     2. Extract contributors from git history
     3. Create a survey document (one per run, idempotent re-start)
-    4. Send survey emails
+    4. Queue survey emails (sent after the response; outcome lands in email_dispatch)
     5. Return survey summary
     """
-    proj, run = await _get_project_and_run(project_id, run_id, current_user)
+    proj, run = await _get_project_and_run(project_oid, run_oid, current_user)
 
     # Resolve repo path (same logic as projects.py trigger run)
     user_dir  = UPLOAD_DIR / f"user_{str(current_user['_id'])}"
@@ -126,8 +233,21 @@ async def start_survey(
             detail=f"Cloned repository not found at {repo_path}. Re-run the analysis first.",
         )
 
-    # Extract contributors
-    contributors_raw = extract_contributors(repo_path)
+    # Extract contributors, reusing the project's cached list while HEAD is unchanged
+    head_sha = await asyncio.to_thread(get_head_sha, repo_path)
+    cache = proj.get("contributors_cache") or {}
+    if head_sha and cache.get("head_sha") == head_sha:
+        contributors_raw = cache.get("contributors", [])
+    else:
+        contributors_raw = await asyncio.to_thread(extract_contributors, repo_path)
+        if contributors_raw and head_sha:
+            await projects_collection.update_one(
+                {"_id": proj["_id"]},
+                {"$set": {"contributors_cache": {
+                    "head_sha":     head_sha,
+                    "contributors": contributors_raw,
+                }}},
+            )
     if not contributors_raw:
         raise HTTPException(
             status_code=400,
@@ -137,8 +257,8 @@ async def start_survey(
 
     # Check for existing survey — allow re-send but don't duplicate
     existing = await surveys_collection.find_one({
-        "project_id": ObjectId(project_id),
-        "run_id":     ObjectId(run_id),
+        "project_id": project_oid,
+        "run_id":     run_oid,
     })
 
     if existing:
@@ -154,11 +274,14 @@ async def start_survey(
                 "token":     token,
                 "submitted": existing_c.get("submitted", False) if existing_c else False,
             })
-        await surveys_collection.update_one(
+        survey = await surveys_collection.find_one_and_update(
             {"_id": existing["_id"]},
-            {"$set": {"contributors": contributors_with_tokens}},
+            {"$set": {
+                "contributors":   contributors_with_tokens,
+                "email_dispatch": {"status": "queued"},
+            }},
+            return_document=ReturnDocument.AFTER,
         )
-        survey_id = str(existing["_id"])
     else:
         contributors_with_tokens = [
             {
@@ -170,51 +293,80 @@ async def start_survey(
             for c in contributors_raw
         ]
         survey_doc = {
-            "project_id":    ObjectId(project_id),
-            "run_id":        ObjectId(run_id),
+            "project_id":    project_oid,
+            "run_id":        run_oid,
             "project_name":  proj["name"],
             "contributors":  contributors_with_tokens,
-            "created_at":    datetime.now(timezone.utc),
+            "created_at":    datetime.now(_UTC),
             "dds":           None,
             "quadrant_results": None,
+            "dds_state":     DDSAccumulator().to_state(),
+            "email_dispatch": {"status": "queued"},
         }
         result = await surveys_collection.insert_one(survey_doc)
-        survey_id = str(result.inserted_id)
-
-    # Send emails (async, best-effort)
-    email_result = await send_survey_emails(
-        contributors=contributors_with_tokens,
-        survey_id=survey_id,
-        project_name=proj["name"],
-        base_url=settings.frontend_url,
+        survey_doc["_id"] = result.inserted_id
+        survey = survey_doc
+
+    # Send emails after the response (best-effort); SMTP per recipient can take minutes
+    background_tasks.add_task(
+        _dispatch_survey_emails,
+        survey["_id"],
+        contributors_with_tokens,
+        proj["name"],
     )
 
-    # Reload and return
-    updated = await surveys_collection.find_one({"_id": ObjectId(survey_id)})
-    response = _survey_to_dict(updated)
-    response["email_dispatch"] = email_result
-
-    return response
+    return _survey_to_dict(survey)
 
 
 # ── PROTECTED: get survey status ───────────────────────────────────────────────
 
 @router.get("/api/projects/{project_id}/runs/{run_id}/survey")
 async def get_survey(
-    project_id: str,
-    run_id: str,
+    project_oid: ProjectObjectId,
+    run_oid: RunObjectId,
     current_user: dict = Depends(get_current_user),
 ):
     """Return survey status, contributor submission state, DDS and quadrant results."""
-    await _get_project_and_run(project_id, run_id, current_user)
+    # Ownership check, run status and survey in a single round-trip (this is polled)
+    rows = await projects_collection.aggregate([
+        {"$match": {"_id": project_oid, "user_id": current_user["_id"]}},
+        {"$project": {"_id": 1}},
+        {"$lookup": {
+            "from": "runs",
+            "pipeline": [
+                {"$match": {"_id": run_oid, "project_id": project_oid}},
+                {"$project": {"status": 1}},
+            ],
+            "as": "run",
+        }},
+        {"$lookup": {
+            "from": "surveys",
+            "pipeline": [
+                {"$match": {"project_id": project_oid, "run_id": run_oid}},
+                {"$limit": 1},
+            ],
+            "as": "survey",
+        }},
+    ]).to_list(length=1)
 
-    survey = await surveys_collection.find_one({
-        "project_id": ObjectId(project_id),
-        "run_id":     ObjectId(run_id),
-    })
+    if not rows:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not rows[0]["run"]:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if rows[0]["run"][0].get("status") != "completed":
+        raise HTTPException(status_code=400, detail="Run is not completed yet")
 
-    if not survey:
+    if not rows[0]["survey"]:
         return {"exists": False}
+    survey = rows[0]["survey"][0]
+
+    # Results lag the running totals (a refresh timer lost to a restart, or
+    # one not yet fired): recompute now
+    dds_state = survey.get("dds_state")
+    if dds_state and dds_state.get("responses", 0) != survey.get("dds_responses", 0):
+        fields = await _refresh_survey_results(survey["_id"], run_oid, dds_state)
+        if fields:
+            survey.update(fields)
 
     result = _survey_to_dict(survey)
     result["exists"] = True
@@ -229,7 +381,11 @@ async def get_survey_form(token: str):
     Public endpoint — no auth required.
     Returns project name + the 15 smell prompts for the survey form.
     """
-    survey = await surveys_collection.find_one({"contributors.token": token})
+    # Positional projection: only this contributor's entry comes back
+    survey = await surveys_collection.find_one(
+        {"contributors.token": token},
+        {"contributors.$": 1, "project_name": 1},
+    )
     if not survey:
         raise HTTPException(status_code=404, detail="Invalid or expired survey link.")
 
@@ -244,21 +400,12 @@ async def get_survey_form(token: str):
     if contributor.get("submitted"):
         return {"already_submitted": True, "project_name": survey.get("project_name", "")}
 
-    smells = [
-        {
-            "abbreviation": abbr,
-            "name":         ABBR_TO_NAME.get(abbr, abbr),
-            "description":  SMELL_DESCRIPTIONS.get(abbr, ""),
-        }
-        for abbr in SMELL_ORDER
-    ]
-
     return {
         "already_submitted": False,
         "survey_id":         str(survey["_id"]),
         "project_name":      survey.get("project_name", ""),
         "contributor_name":  contributor["name"],
-        "smells":            smells,
+        "smells":            _SMELL_PAYLOAD,
     }
 
 
@@ -274,7 +421,10 @@ async def submit_survey(token: str, submission: SurveySubmission):
     Public endpoint — no auth required.
     Saves ratings, marks contributor as submitted, recalculates DDS + quadrant results.
     """
-    survey = await surveys_collection.find_one({"contributors.token": token})
+    survey = await surveys_collection.find_one(
+        {"contributors.token": token},
+        {"contributors.$": 1, "project_id": 1, "run_id": 1, "dds_state": 1},
+    )
     if not survey:
         raise HTTPException(status_code=404, detail="Invalid or expired survey link.")
 
@@ -289,20 +439,34 @@ async def submit_survey(token: str, submission: SurveySubmission):
         raise HTTPException(status_code=400, detail="You have already submitted your response.")
 
     # Validate ratings: 1–5, only known smells accepted
-    valid_ratings: Dict[str, int] = {}
-    for abbr in SMELL_ORDER:
-        val = submission.ratings.get(abbr)
-        if val is None:
-            raise HTTPException(
-                status_code=422,
-                detail=f"Missing rating for smell: {abbr}",
-            )
-        if not isinstance(val, int) or val < 1 or val > 5:
-            raise HTTPException(
-                status_code=422,
-                detail=f"Rating for {abbr} must be an integer 1–5, got: {val}",
-            )
-        valid_ratings[abbr] = val
+    ratings = submission.ratings
+    valid_ratings: Dict[str, int] = {abbr: ratings.get(abbr) for abbr in SMELL_ORDER}
+    if not all(type(v) is int and 1 <= v <= 5 for v in valid_ratings.values()):
+        # Only walk field by field to report the first offending rating
+        for abbr, val in valid_ratings.items():
+            if val is None:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Missing rating for smell: {abbr}",
+                )
+            if not isinstance(val, int) or val < 1 or val > 5:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Rating for {abbr} must be an integer 1–5, got: {val}",
+                )
+
+    # Claim the submission atomically: only the first request for this token
+    # flips submitted, so concurrent re-submits can't both record ratings
+    claim = await surveys_collection.update_one(
+        {
+            "_id": survey["_id"],
+            "contributors": {"$elemMatch": {"token": token, "submitted": {"$ne": True}}},
+        },
+        {"$set": {"contributors.$[c].submitted": True}},
+        array_filters=[{"c.token": token}],
+    )
+    if claim.modified_count == 0:
+        raise HTTPException(status_code=400, detail="You have already submitted your response.")
 
     # Save response
     response_doc = {
@@ -311,46 +475,42 @@ async def submit_survey(token: str, submission: SurveySubmission):
         "run_id":             survey["run_id"],
         "contributor_token":  token,
         "ratings":            valid_ratings,
-        "submitted_at":       datetime.now(timezone.utc),
+        "submitted_at":       datetime.now(_UTC),
     }
     await survey_responses_collection.insert_one(response_doc)
 
-    # Mark contributor as submitted
-    updated_contributors = []
-    for c in survey.get("contributors", []):
-        entry = dict(c)
-        if entry["token"] == token:
-            entry["submitted"] = True
-        updated_contributors.append(entry)
-
-    # Recalculate DDS from ALL responses for this survey
-    all_responses = await survey_responses_collection.find(
-        {"survey_id": survey["_id"]}
-    ).to_list(length=None)
-
-    new_dds = calculate_dds(all_responses)
-
-    # Recompute quadrant results if we have DDS
-    new_quadrant = None
-    if new_dds:
-        run_doc = await runs_collection.find_one({"_id": survey["run_id"]})
-        if run_doc:
-            new_quadrant = calculate_quadrant_results(
-                run_doc.get("smell_analysis"), new_dds
-            )
+    # Update DDS: fold this response into the survey's running totals atomically
+    if "dds_state" in survey:
+        inc = {"dds_state.responses": 1}
+        for abbr, val in valid_ratings.items():
+            inc[f"dds_state.sums.{abbr}"] = val
+            inc[f"dds_state.counts.{abbr}"] = 1
+        updated = await surveys_collection.find_one_and_update(
+            {"_id": survey["_id"]},
+            {"$inc": inc},
+            projection={"dds_state": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        responses_so_far = updated["dds_state"]["responses"]
+    else:
+        # Surveys started before dds_state existed: rebuild the totals once from ALL responses
+        acc = DDSAccumulator()
+        async for resp in survey_responses_collection.find(
+            {"survey_id": survey["_id"]}, {"ratings": 1}
+        ):
+            acc.add(resp.get("ratings", {}))
+        await surveys_collection.update_one(
+            {"_id": survey["_id"]},
+            {"$set": {"dds_state": acc.to_state()}},
+        )
+        responses_so_far = acc.responses
 
-    # Persist updates
-    await surveys_collection.update_one(
-        {"_id": survey["_id"]},
-        {"$set": {
-            "contributors":     updated_contributors,
-            "dds":              new_dds,
-            "quadrant_results": new_quadrant,
-        }},
-    )
+    # DDS + quadrant results are written shortly after, once per burst of submissions
+    _schedule_results_refresh(survey["_id"], survey["run_id"])
 
     return {
         "success":          True,
         "message":          "Thank you! Your response has been recorded.",
-        "responses_so_far": len(all_responses),
+        "responses_so_far": responses_so_far,
+        "dds_pending":      True,
     }
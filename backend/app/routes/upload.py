@@ -4,25 +4,138 @@ from app.services.smell_detection import detect_smells_for_project
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
 from pydantic import BaseModel
+import asyncio
+import io
 import os
-import stat
 import shutil
 import zipfile
-import subprocess
+from itertools import repeat
 from pathlib import Path
 from app.core.security import get_current_user
+from app.services.repo_clone import GitCloneError, GitCloneTimeout, clone_repository
 from app.services.smell_detection import detect_smells_for_project
+from app.utils.filesystem import directory_lock, move_to_trash, remove_tree
+from app.utils.process_pool import pool_map
 
 router = APIRouter(prefix="/api/upload", tags=["upload"])
 
 UPLOAD_DIR = Path("uploaded_projects")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Chunk size for spooling uploaded ZIPs to disk (shutil's default is 64KB)
+_COPY_BUFSIZE = 4 * 1024 * 1024
+
+
+# Zip-bomb guard: limits checked against the central directory before inflating
+_MAX_ZIP_ENTRIES = 50_000
+_MAX_UNCOMPRESSED_BYTES = 2 * 1024 ** 3
+
+# Archives with fewer members are extracted serially; below this the worker
+# start-up cost outweighs parallel inflation
+_PARALLEL_EXTRACT_MIN_MEMBERS = 64
+_EXTRACT_BATCH_SIZE = 32
+
+
+# Deletions of replaced project copies. Started as their own tasks rather
+# than BackgroundTasks, which are dropped when the handler raises, and held
+# here until done so they aren't garbage-collected.
+_pending_removals: set = set()
+
+
+def _remove_in_background(trash: Path) -> None:
+    task = asyncio.ensure_future(asyncio.to_thread(remove_tree, trash))
+    _pending_removals.add(task)
+    task.add_done_callback(_pending_removals.discard)
+
+
+def _extract_batch(zip_path: str, names: list, dest: str) -> None:
+    """Worker: extract a batch of members through its own ZipFile handle."""
+    with zipfile.ZipFile(zip_path) as zf:
+        for name in names:
+            zf.extract(name, dest)
+
+
+def _member_dirs(members: list, root: str) -> set:
+    """
+    Directories the members extract into. Rejects members that would land
+    outside root (absolute paths, '..' components, symlinked escapes).
+    """
+    dirs = set()
+    for m in members:
+        target = os.path.realpath(os.path.join(root, m.filename))
+        if os.path.isabs(m.filename) or ".." in Path(m.filename).parts or \
+                not (target == root or target.startswith(root + os.sep)):
+            raise HTTPException(status_code=400, detail=f"Unsafe path in ZIP: {m.filename}")
+        dirs.add(target if m.is_dir() else os.path.dirname(target))
+    return dirs
+
+
+def _copy_upload(upload, dest: Path) -> None:
+    """
+    Write the spooled upload to dest. Uses sendfile (kernel-side copy)
+    where available, otherwise chunked copyfileobj.
+    """
+    upload.seek(0)
+    # Unbuffered destination: both paths already write in large chunks
+    with open(dest, "wb", buffering=0) as buffer:
+        if hasattr(os, "sendfile"):
+            try:
+                src_fd = upload.fileno()  # rolls an in-memory spool over to disk
+                upload.flush()
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                src_fd = None
+            if src_fd is not None:
+                size = os.fstat(src_fd).st_size
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(buffer.fileno(), src_fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return
+        shutil.copyfileobj(upload, buffer, _COPY_BUFSIZE)
+
+
+def _extract_upload(upload, zip_path: Path, dest: Path) -> None:
+    """
+    Extract an uploaded ZIP into dest.
+
+    Small archives are read straight from the upload's spooled file. Large
+    ones are first written to zip_path so worker processes can each open it
+    and spread DEFLATE inflation across cores.
+    """
+    root = os.path.realpath(dest)
+    upload.seek(0)
+    try:
+        zf = zipfile.ZipFile(upload)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a valid ZIP archive")
+    with zf:
+        members = zf.infolist()
+        if len(members) > _MAX_ZIP_ENTRIES:
+            raise HTTPException(status_code=400, detail=f"ZIP has more than {_MAX_ZIP_ENTRIES} entries")
+        if sum(m.file_size for m in members) > _MAX_UNCOMPRESSED_BYTES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"ZIP expands to more than {_MAX_UNCOMPRESSED_BYTES // 1024 ** 3} GB",
+            )
+        dirs = _member_dirs(members, root)
+        if len(members) < _PARALLEL_EXTRACT_MIN_MEMBERS:
+            zf.extractall(dest)
+            return
+
+    _copy_upload(upload, zip_path)
 
-def _force_remove(func, path, _excinfo):
-    """Error handler for shutil.rmtree — removes read-only flag on Windows before retrying."""
-    os.chmod(path, stat.S_IWRITE)
-    func(path)
+    try:
+        # Create the tree up front so workers never race on makedirs
+        for d in dirs:
+            os.makedirs(d, exist_ok=True)
+
+        names = [m.filename for m in members if not m.is_dir()]
+        batches = [names[i:i + _EXTRACT_BATCH_SIZE] for i in range(0, len(names), _EXTRACT_BATCH_SIZE)]
+        pool_map(_extract_batch, repeat(str(zip_path)), batches, repeat(str(dest)))
+    finally:
+        zip_path.unlink()
 
 
 class GithubRepoRequest(BaseModel):
@@ -50,21 +163,21 @@ async def upload_github_repo(
 
         project_dir = user_dir / repo_name
 
-        if project_dir.exists():
-            shutil.rmtree(project_dir, onerror=_force_remove)
-
-        result = subprocess.run(
-            ["git", "clone", repo_url, str(project_dir)],
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        # Project runs clone into the same directory; one at a time
+        async with directory_lock(project_dir):
+            # Move the previous copy aside and delete it in the background
+            if project_dir.exists():
+                _remove_in_background(move_to_trash(project_dir))
 
-        if result.returncode != 0:
-            raise HTTPException(status_code=400, detail=result.stderr)
+            try:
+                await clone_repository(repo_url, project_dir)
+            except GitCloneTimeout as e:
+                raise HTTPException(status_code=504, detail=str(e))
+            except GitCloneError as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
-        # 🔥 Call smell detection
-        smell_result = detect_smells_for_project(project_dir)
+            # 🔥 Call smell detection
+            smell_result = await asyncio.to_thread(detect_smells_for_project, project_dir)
 
         return {
             "message": "Repository cloned successfully",
@@ -72,6 +185,8 @@ async def upload_github_repo(
             "smell_analysis": smell_result
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -94,22 +209,19 @@ async def upload_zip_file(
         project_name = file.filename.replace('.zip', '')
         project_dir = user_dir / project_name
 
-        if project_dir.exists():
-            shutil.rmtree(project_dir, onerror=_force_remove)
+        # Re-uploads of the same archive replace this directory; one at a time
+        async with directory_lock(project_dir):
+            # Move the previous copy aside and delete it in the background
+            if project_dir.exists():
+                _remove_in_background(move_to_trash(project_dir))
 
-        project_dir.mkdir(exist_ok=True)
+            project_dir.mkdir(exist_ok=True)
 
-        zip_path = user_dir / file.filename
-        with open(zip_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(project_dir)
-
-        zip_path.unlink()
+            # Inflation is CPU/disk work; keep it off the event loop
+            await asyncio.to_thread(_extract_upload, file.file, user_dir / file.filename, project_dir)
 
-        # 🔥 Call smell detection
-        smell_result = detect_smells_for_project(project_dir)
+            # 🔥 Call smell detection
+            smell_result = await asyncio.to_thread(detect_smells_for_project, project_dir)
 
         return {
             "message": "ZIP uploaded successfully",
@@ -117,5 +229,7 @@ async def upload_zip_file(
             "smell_analysis": smell_result
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -23,9 +23,13 @@ test files in the repository (one data point per file).
 
 import re
 import subprocess
+import sys
+import threading
+from array import array
 from pathlib import Path
-from typing import List, Dict, Optional, Set
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
 from collections import defaultdict
+from functools import lru_cache
 
 import numpy as np
 from scipy.stats import spearmanr
@@ -40,118 +44,170 @@ FAULT_KEYWORDS = [
     'crash', 'patch', 'repair', 'correct', 'resolve',
 ]
 
+# One alternation scanned once per message instead of a substring scan per
+# keyword. Deliberately no word boundaries: 'fixed', 'bugs', 'resolves' etc.
+# must keep counting as fault-fixing commits
+_FAULT_RE = re.compile('|'.join(map(re.escape, FAULT_KEYWORDS)))
+
+GIT_LOG_TIMEOUT = 120
+
+# Bump whenever the git-based metrics' output changes, so stored analyses
+# computed by older code are not reused (see smell_detection.ANALYSIS_VERSION)
+GIT_METRICS_VERSION = 2
+
 
 # =====================================================
 # STEP 1 - GIT HISTORY EXTRACTION
 # =====================================================
 
-def extract_git_history(repo_path: Path) -> List[Dict]:
-    """
-    Extract full commit history from a Git repository using --numstat.
+class GitHistoryError(RuntimeError):
+    """The path is not a git repository or git log failed."""
 
-    Each commit dict:
+
+def iter_git_history(repo_path: Path) -> Iterator[Dict]:
+    """
+    Yield the commits of HEAD's history (merges excluded) as git log emits
+    them, each as:
     {
         'hash':          str,
         'message':       str,
-        'timestamp':     str,
         'is_faulty':     bool,
-        'files_changed': { filename: {'additions': int, 'deletions': int} }
+        'files_changed': { filename: (additions, deletions) }
     }
+
+    Raises GitHistoryError if repo_path is not a repository or git fails;
+    commits yielded before a failure should be discarded.
     """
-    commits = []
+    # Stream the log and parse it record by record rather than buffering
+    # the whole --numstat output, which runs to hundreds of MB on big repos.
+    # -z gives NUL-terminated records and unquoted paths, so names with
+    # newlines or non-ASCII characters come through intact.
+    # --no-renames skips git's rename detection (costly on big commits)
+    # and reports a rename as delete + add of the real paths instead of
+    # an "old => new" pseudo-path that matches no file
+    proc = subprocess.Popen(
+        ['git', 'log', '-z', '--numstat', '--no-renames', '--format=%x1e%H%x1f%s', '--no-merges'],
+        cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    timer = threading.Timer(GIT_LOG_TIMEOUT, proc.kill)
+    timer.start()
 
     try:
-        check = subprocess.run(
-            ['git', 'rev-parse', '--git-dir'],
-            cwd=repo_path, capture_output=True, text=True, timeout=10
-        )
-        if check.returncode != 0:
-            print(f"[ERROR] Not a git repository: {repo_path}")
-            return []
-
-        result = subprocess.run(
-            ['git', 'log', '--numstat', '--format=%H|%s|%ai', '--no-merges'],
-            cwd=repo_path, capture_output=True, text=True, timeout=120
-        )
-        if result.returncode != 0:
-            print(f"[ERROR] git log failed: {result.stderr}")
-            return []
-
-        current_commit: Optional[Dict] = None
-
-        for line in result.stdout.strip().split('\n'):
-            line = line.rstrip()
-
-            # Commit header line: "HASH|subject|date"
-            if '|' in line and len(line) > 40 and re.match(r'^[0-9a-f]{7,40}\|', line):
-                if current_commit:
-                    commits.append(current_commit)
-                parts = line.split('|', 2)
-                if len(parts) == 3:
-                    current_commit = {
-                        'hash':          parts[0].strip(),
-                        'message':       parts[1].strip(),
-                        'timestamp':     parts[2].strip(),
-                        'is_faulty':     _is_faulty_commit(parts[1]),
-                        'files_changed': {},
-                    }
-
-            # Numstat file line: "additions<TAB>deletions<TAB>filename"
-            elif line and current_commit and '\t' in line:
-                parts = line.split('\t')
-                if len(parts) == 3:
-                    add_str, del_str, filename = parts
-                    additions = 0 if add_str == '-' else int(add_str)
-                    deletions = 0 if del_str == '-' else int(del_str)
-                    current_commit['files_changed'][filename] = {
-                        'additions': additions,
-                        'deletions': deletions,
-                    }
-
-        if current_commit:
-            commits.append(current_commit)
-
-    except Exception as exc:
-        print(f"[ERROR] extract_git_history: {exc}")
-        return []
-
-    print(f"[GIT] Extracted {len(commits)} commits from {repo_path.name}")
-    return commits
+        yield from _iter_commits(_iter_records(proc.stdout))
+    finally:
+        # Closing our end stops git early if parsing bailed out mid-log
+        # (or the consumer stopped iterating)
+        timer.cancel()
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.wait()
+
+    if proc.returncode != 0:
+        # No separate rev-parse precheck: git log itself reports non-repos
+        if b'not a git repository' in stderr.lower():
+            raise GitHistoryError(f"Not a git repository: {repo_path}")
+        raise GitHistoryError(f"git log failed: {stderr.decode(errors='replace')}")
+
+
+def _iter_records(stream: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    """Yield the NUL-terminated records of a `git log -z` byte stream."""
+    buf = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        start = 0
+        end = buf.find(b'\x00')
+        while end != -1:
+            yield buf[start:end]
+            start = end + 1
+            end = buf.find(b'\x00', start)
+        buf = buf[start:]
+    if buf:
+        yield buf
+
+
+def _iter_commits(records: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    Parse `git log -z --numstat --format=%x1e%H%x1f%s` records, yielding
+    each commit dict as soon as its numstat block ends, so callers can
+    consume the log while git is still producing it.
+    """
+    current_commit: Optional[Dict] = None
+    # Raw path -> decoded, interned name: each path is decoded once and every
+    # commit touching it shares one string object
+    paths: Dict[bytes, str] = {}
+
+    for record in records:
+        # Commit header: "\x1eHASH\x1fsubject". The record separator can't
+        # appear in numstat output, so subjects containing anything parse
+        if record.startswith(b'\x1e'):
+            if current_commit:
+                yield current_commit
+            commit_hash, sep, subject = record[1:].partition(b'\x1f')
+            if sep:
+                message = subject.decode('utf-8', 'replace')
+                current_commit = {
+                    'hash':          commit_hash.decode('ascii'),
+                    'message':       message.strip(),
+                    'is_faulty':     _is_faulty_commit(message),
+                    'files_changed': {},
+                }
+
+        # Numstat record: "additions<TAB>deletions<TAB>path". With -z the
+        # path is raw (never quoted or escaped); the first record after a
+        # header carries the "\n" that separates it from the diff
+        elif current_commit and b'\t' in record:
+            add_str, _, rest = record.lstrip(b'\n').partition(b'\t')
+            del_str, sep, filename = rest.partition(b'\t')
+            if sep:
+                path = paths.get(filename)
+                if path is None:
+                    path = paths[filename] = sys.intern(filename.decode('utf-8', 'replace'))
+                current_commit['files_changed'][path] = (
+                    0 if add_str == b'-' else int(add_str),
+                    0 if del_str == b'-' else int(del_str),
+                )
+
+    if current_commit:
+        yield current_commit
 
 
 def _is_faulty_commit(message: str) -> bool:
     """Return True if the commit message indicates a bug fix."""
-    msg = message.lower()
-    return any(kw in msg for kw in FAULT_KEYWORDS)
+    return _FAULT_RE.search(message.lower()) is not None
 
 
 # =====================================================
 # STEP 2 - FILE CLASSIFICATION
 # =====================================================
 
+# Any of: '/test_', '/tests/', a leading 'test_' or 'tests/', or '_test.'
+# (matched against the lowercased, '/'-separated path)
+_TEST_PATH_RE = re.compile(r'(?:^|/)(?:test_|tests/)|_test\.')
+
+
+@lru_cache(maxsize=65536)
 def is_test_file(filename: str) -> bool:
     """Return True if filename looks like a test file."""
     f = filename.lower().replace('\\', '/')
-    return (
-        '/test_'   in f or
-        '_test.'   in f or
-        '/tests/'  in f or
-        f.startswith('test_') or
-        f.startswith('tests/')
-    )
+    return _TEST_PATH_RE.search(f) is not None
 
 
+@lru_cache(maxsize=65536)
 def is_production_file(filename: str) -> bool:
     """Return True if filename is a non-test Python source file."""
     f = filename.lower()
     return (
         f.endswith('.py') and
-        not is_test_file(f) and
         not f.endswith('__init__.py') and
-        'setup.py' not in f
+        'setup.py' not in f and
+        _TEST_PATH_RE.search(f.replace('\\', '/')) is None
     )
 
 
+@lru_cache(maxsize=65536)
 def _normalize(path: str) -> str:
     return path.replace('\\', '/').lower().strip('/')
 
@@ -168,39 +224,159 @@ def paths_match(smell_path: str, git_path: str) -> bool:
     return fa == fb and fa.startswith('test')
 
 
+def _path_matcher(paths: List[str]) -> Callable[[str], List[str]]:
+    """
+    Return find(path) -> every entry of paths that paths_match(path, ...),
+    in list order. Equivalent to scanning paths in order, but only tests
+    candidates that can match:
+      - paths with the same basename (covers equal paths, suffixes that
+        contain a '/', and the same-test-basename rule);
+      - root-level paths equal to a suffix of path's basename;
+      - for a root-level path, paths whose basename ends with it.
+    """
+    order = {p: i for i, p in enumerate(paths)}
+    by_base: Dict[str, List[str]] = defaultdict(list)
+    root_level: Dict[str, List[str]] = defaultdict(list)
+    for p in paths:
+        norm = _normalize(p)
+        by_base[norm.rpartition('/')[2]].append(p)
+        if '/' not in norm:
+            root_level[norm].append(p)
+
+    def find(path: str) -> List[str]:
+        a = _normalize(path)
+        base = a.rpartition('/')[2]
+        candidates = list(by_base.get(base, ()))
+        for i in range(1, len(base)):
+            candidates.extend(root_level.get(base[i:], ()))
+        if '/' not in a:
+            for other_base, paths in by_base.items():
+                if other_base != base and other_base.endswith(a):
+                    candidates.extend(paths)
+        matches = [c for c in candidates if paths_match(path, c)]
+        matches.sort(key=order.__getitem__)
+        return matches
+
+    return find
+
+
 # =====================================================
-# STEP 3 - RAW FILE METRICS FROM GIT
+# STEP 3 - RAW FILE METRICS + CO-CHANGES FROM GIT (one pass)
 # =====================================================
 
-def _build_file_metrics(commits: List[Dict]) -> Dict[str, Dict]:
+_OTHER_FILE, _TEST_FILE, _PROD_FILE = 0, 1, 2
+
+
+class _GitHistory(NamedTuple):
     """
-    Aggregate per-file commit statistics from the full history.
+    Aggregated commit history. Files are identified by dense integer ids
+    (file_ids); per-file arrays are indexed by id.
 
-    Returns:
-        { filename: {
-            'total_changes':  int,
-            'total_churn':    int,
-            'faulty_changes': int,
-            'faulty_churn':   int,
-        }}
+    file_counts columns: total_changes, total_churn, faulty_changes,
+    faulty_churn. cochange_pairs holds the distinct (test file id, prod file
+    id) pairs committed together, sorted, one pair per row.
     """
-    metrics: Dict[str, Dict] = defaultdict(lambda: {
-        'total_changes':  0,
-        'total_churn':    0,
-        'faulty_changes': 0,
-        'faulty_churn':   0,
-    })
+    total_commits:  int
+    faulty_commits: int
+    file_ids:       Dict[str, int]
+    file_kinds:     np.ndarray
+    file_counts:    np.ndarray
+    cochange_pairs: np.ndarray
 
-    for commit in commits:
-        for filename, change in commit['files_changed'].items():
-            churn = change['additions'] + change['deletions']
-            metrics[filename]['total_changes']  += 1
-            metrics[filename]['total_churn']    += churn
-            if commit['is_faulty']:
-                metrics[filename]['faulty_changes'] += 1
-                metrics[filename]['faulty_churn']   += churn
 
-    return dict(metrics)
+# Raw co-change pairs are deduplicated whenever this many have piled up, so
+# dense histories can't grow the pair buffers without bound
+_PAIR_COMPACT_THRESHOLD = 1 << 22
+
+
+def _unique_pairs(chunks: List[np.ndarray]) -> np.ndarray:
+    if not chunks:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(chunks), axis=0)
+
+
+def _aggregate_history(commits: Iterable[Dict]) -> _GitHistory:
+    """
+    Single pass over the commit history, so it can consume iter_git_history
+    directly without keeping the commits around.
+    """
+    # One flat row per (commit, file) change, keyed by a dense file id, then
+    # summed per file with NumPy instead of four dict updates per change.
+    # Each distinct path is classified as test / production once
+    file_ids: Dict[str, int] = {}
+    kinds: List[int] = []
+    ids: List[int] = []
+    churns: List[int] = []
+    faulty: List[bool] = []
+    pair_tests = array('q')
+    pair_prods = array('q')
+    pair_chunks: List[np.ndarray] = []
+    total_commits = faulty_commits = 0
+
+    for commit in commits:
+        total_commits += 1
+        is_faulty = commit['is_faulty']
+        faulty_commits += is_faulty
+        changed_test: List[int] = []
+        changed_prod: List[int] = []
+
+        for filename, (additions, deletions) in commit['files_changed'].items():
+            fid = file_ids.get(filename)
+            if fid is None:
+                fid = file_ids[filename] = len(file_ids)
+                kinds.append(
+                    _TEST_FILE if is_test_file(filename) else
+                    _PROD_FILE if is_production_file(filename) else
+                    _OTHER_FILE
+                )
+            ids.append(fid)
+            churns.append(additions + deletions)
+            faulty.append(is_faulty)
+
+            kind = kinds[fid]
+            if kind == _TEST_FILE:
+                changed_test.append(fid)
+            elif kind == _PROD_FILE:
+                changed_prod.append(fid)
+
+        if changed_test and changed_prod:
+            for tid in changed_test:
+                pair_tests.extend([tid] * len(changed_prod))
+                pair_prods.extend(changed_prod)
+            if len(pair_tests) >= _PAIR_COMPACT_THRESHOLD:
+                pair_chunks = [_unique_pairs(pair_chunks + [
+                    np.column_stack([np.frombuffer(pair_tests, dtype=np.int64),
+                                     np.frombuffer(pair_prods, dtype=np.int64)])
+                ])]
+                pair_tests = array('q')
+                pair_prods = array('q')
+
+    n = len(file_ids)
+    id_arr    = np.array(ids, dtype=np.int64)
+    churn_arr = np.array(churns, dtype=np.int64)
+    fault_arr = np.array(faulty, dtype=bool)
+
+    # bincount is a single C loop per counter (np.add.at's unbuffered path is
+    # far slower); float weights are exact for any realistic churn total
+    faulty_ids = id_arr[fault_arr]
+    file_counts = np.column_stack([
+        np.bincount(id_arr, minlength=n),
+        np.bincount(id_arr, weights=churn_arr, minlength=n),
+        np.bincount(faulty_ids, minlength=n),
+        np.bincount(faulty_ids, weights=churn_arr[fault_arr], minlength=n),
+    ]).astype(np.int64).reshape(n, 4)
+
+    return _GitHistory(
+        total_commits=total_commits,
+        faulty_commits=faulty_commits,
+        file_ids=file_ids,
+        file_kinds=np.array(kinds, dtype=np.int8),
+        file_counts=file_counts,
+        cochange_pairs=_unique_pairs(pair_chunks + [
+            np.column_stack([np.array(pair_tests, dtype=np.int64),
+                             np.array(pair_prods, dtype=np.int64)])
+        ]),
+    )
 
 
 # =====================================================
@@ -209,33 +385,37 @@ def _build_file_metrics(commits: List[Dict]) -> Dict[str, Dict]:
 
 def _build_cochange_map(
     test_files: List[str],
-    commits: List[Dict],
-) -> Dict[str, Set[str]]:
+    history: _GitHistory,
+) -> tuple:
     """
     For each test file, find all production files committed together with it
     (co-change pattern from the paper).
 
-    Returns:
-        { test_file: set(prod_file, ...) }
-    """
-    cochange: Dict[str, Set[str]] = defaultdict(set)
+    Each git test path in history.cochange_pairs is matched to its canonical
+    test file once (the first of test_files it paths_match-es), then the
+    pairs are regrouped by canonical row.
 
-    for commit in commits:
-        changed = list(commit['files_changed'].keys())
-        changed_test = [f for f in changed if is_test_file(f)]
-        changed_prod = [f for f in changed if is_production_file(f)]
+    Returns (indptr, prod_ids) in CSR form: the production file ids
+    co-changed with test_files[i] are prod_ids[indptr[i]:indptr[i + 1]].
+    """
+    pairs = history.cochange_pairs
+    git_paths = list(history.file_ids)
+    find_test_files = _path_matcher(test_files)
+    test_row = {tf: i for i, tf in enumerate(test_files)}
 
-        if not changed_test or not changed_prod:
-            continue
+    git_test_ids = np.unique(pairs[:, 0])
+    row_of = np.full(len(git_paths), -1, dtype=np.int64)
+    for tid in git_test_ids:
+        matches = find_test_files(git_paths[tid])
+        if matches:
+            row_of[tid] = test_row[matches[0]]
 
-        for tf in changed_test:
-            for canonical_tf in test_files:
-                if paths_match(canonical_tf, tf):
-                    for pf in changed_prod:
-                        cochange[canonical_tf].add(pf)
-                    break
+    rows = row_of[pairs[:, 0]]
+    keep = rows >= 0
+    grouped = np.unique(np.column_stack([rows[keep], pairs[keep, 1]]), axis=0)
 
-    return dict(cochange)
+    indptr = np.searchsorted(grouped[:, 0], np.arange(len(test_files) + 1))
+    return indptr, grouped[:, 1]
 
 
 # =====================================================
@@ -244,10 +424,9 @@ def _build_cochange_map(
 
 def _build_combined_vectors(
     test_files: List[str],
-    file_metrics: Dict[str, Dict],
-    cochange_map: Dict[str, Set[str]],
-    total_commits: int,
-) -> Dict[str, Dict[str, float]]:
+    history: _GitHistory,
+    cochange_map: tuple,
+) -> np.ndarray:
     """
     For every test file compute the four combined metrics (equations 1-4):
 
@@ -259,53 +438,37 @@ def _build_combined_vectors(
     Where:
       Prod_Total = sum of total_changes across ALL production files in the project
       Test_Total = sum of total_changes across ALL test files in the project
+
+    Returns a (len(test_files), 4) float array; columns are ChgFreq, ChgExt,
+    FaultFreq, FaultExt.
     """
+    counts = history.file_counts
+    kinds = history.file_kinds
+
     # Separate denominators as specified in the paper (not a single total_commits)
-    prod_total = sum(
-        m['total_changes'] for f, m in file_metrics.items() if is_production_file(f)
-    ) or 1
-    test_total = sum(
-        m['total_changes'] for f, m in file_metrics.items() if is_test_file(f)
-    ) or 1
-
-    vectors: Dict[str, Dict[str, float]] = {}
-
-    for tf in test_files:
-        tm = file_metrics.get(tf, {})
-        if not tm:
-            for git_path, m in file_metrics.items():
-                if paths_match(tf, git_path):
-                    tm = m
-                    break
-
-        test_changes = tm.get('total_changes',  0)
-        test_churn   = tm.get('total_churn',    0)
-        test_faulty  = tm.get('faulty_changes', 0)
-        test_f_churn = tm.get('faulty_churn',   0)
-
-        prod_files = cochange_map.get(tf, set())
-        prod_changes = prod_churn = prod_faulty = prod_f_churn = 0
-
-        for pf in prod_files:
-            pm = file_metrics.get(pf, {})
-            if not pm:
-                for git_path, m in file_metrics.items():
-                    if paths_match(pf, git_path):
-                        pm = m
-                        break
-            prod_changes += pm.get('total_changes',  0)
-            prod_churn   += pm.get('total_churn',    0)
-            prod_faulty  += pm.get('faulty_changes', 0)
-            prod_f_churn += pm.get('faulty_churn',   0)
-
-        vectors[tf] = {
-            'chg_freq':   (prod_changes / prod_total) + (test_changes / test_total),
-            'chg_ext':    (prod_churn   / prod_total) + (test_churn   / test_total),
-            'fault_freq': (prod_faulty  / prod_total) + (test_faulty  / test_total),
-            'fault_ext':  (prod_f_churn / prod_total) + (test_f_churn / test_total),
-        }
+    prod_total = int(counts[kinds == _PROD_FILE, 0].sum()) or 1
+    test_total = int(counts[kinds == _TEST_FILE, 0].sum()) or 1
+
+    find_git_paths = _path_matcher(list(history.file_ids))
+
+    test_rows = np.zeros((len(test_files), 4), dtype=np.int64)
+
+    for row, tf in enumerate(test_files):
+        fid = history.file_ids.get(tf)
+        if fid is None:
+            matches = find_git_paths(tf)
+            if matches:
+                fid = history.file_ids[matches[0]]
+        if fid is not None:
+            test_rows[row] = counts[fid]
 
-    return vectors
+    # Sum the co-changed production files' counts per test file in one
+    # scatter-add over the CSR segments
+    indptr, prod_ids = cochange_map
+    prod_rows = np.zeros((len(test_files), 4), dtype=np.int64)
+    np.add.at(prod_rows, np.repeat(np.arange(len(test_files)), np.diff(indptr)), counts[prod_ids])
+
+    return prod_rows / prod_total + test_rows / test_total
 
 
 # =====================================================
@@ -331,23 +494,48 @@ SMELL_ABBREVIATIONS = {
 }
 
 
-def _spearman(x: List[float], y: List[float]) -> tuple:
-    """Compute Spearman rho. Returns (0.0, 1.0) if insufficient variance."""
-    arr_x = np.array(x, dtype=float)
-    arr_y = np.array(y, dtype=float)
-
-    if arr_x.std() == 0 or arr_y.std() == 0:
-        return 0.0, 1.0
-    if len(arr_x) < 3:
-        return 0.0, 1.0
+def _spearman_matrix(presence: np.ndarray, metrics: np.ndarray) -> tuple:
+    """
+    Spearman rho / p of every presence row (smell type) against every metric
+    row, from a single spearmanr call over the stacked matrix, so each
+    metric column is ranked once rather than once per smell type.
 
-    rho, p = spearmanr(arr_x, arr_y)
-    return float(rho), float(p)
+    Returns (rho, p) arrays of shape (n_smells, n_metrics). Pairs where
+    either side has no variance, or with fewer than 3 files, get (0.0, 1.0).
+    """
+    n_smells, n_files = presence.shape
+    n_metrics = metrics.shape[0]
+    rho = np.zeros((n_smells, n_metrics))
+    pval = np.ones((n_smells, n_metrics))
+    if n_files < 3:
+        return rho, pval
+
+    # Exact comparison, not std() != 0: on these strided rows std rounds a
+    # constant row to ~1e-17 and it would be ranked, giving NaN instead of 0
+    smell_ok = ~(presence == presence[:, :1]).all(axis=1)
+    metric_ok = ~(metrics == metrics[:, :1]).all(axis=1)
+    if not smell_ok.any() or not metric_ok.any():
+        return rho, pval
+
+    # spearmanr gives up on the whole matrix if a leading column is
+    # constant, so only non-degenerate rows go into the call
+    stacked = np.vstack([presence[smell_ok], metrics[metric_ok]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r, p = spearmanr(stacked.T, axis=0)
+    if np.ndim(r) == 0:
+        # Exactly two variables: spearmanr returns scalars, not a matrix
+        r = np.array([[1.0, r], [r, 1.0]])
+        p = np.array([[0.0, p], [p, 0.0]])
+
+    k = int(smell_ok.sum())
+    rho[np.ix_(smell_ok, metric_ok)] = r[:k, k:]
+    pval[np.ix_(smell_ok, metric_ok)] = p[:k, k:]
+    return rho, pval
 
 
 def calculate_spearman_metrics(
     smell_instances: List[Dict],
-    combined_vectors: Dict[str, Dict[str, float]],
+    combined_vectors: np.ndarray,
     all_test_files: List[str],
 ) -> Dict[str, Dict]:
     """
@@ -361,26 +549,38 @@ def calculate_spearman_metrics(
     for inst in smell_instances:
         smells_by_type[inst['type']].append(inst)
 
-    chg_freq_col   = [combined_vectors.get(tf, {}).get('chg_freq',   0.0) for tf in all_test_files]
-    chg_ext_col    = [combined_vectors.get(tf, {}).get('chg_ext',    0.0) for tf in all_test_files]
-    fault_freq_col = [combined_vectors.get(tf, {}).get('fault_freq', 0.0) for tf in all_test_files]
-    fault_ext_col  = [combined_vectors.get(tf, {}).get('fault_ext',  0.0) for tf in all_test_files]
+    # One row per metric (ChgFreq, ChgExt, FaultFreq, FaultExt)
+    metric_rows = np.asarray(combined_vectors, dtype=float).reshape(len(all_test_files), 4).T
+
+    smell_files_by_type: Dict[str, Set[str]] = {
+        smell_type: set(inst['file'] for inst in instances)
+        for smell_type, instances in smells_by_type.items()
+    }
+    # Resolve each distinct smell file to the test-file rows it matches once,
+    # instead of paths_match-ing every test file against every smell file
+    # for each smell type
+    find_test_files = _path_matcher(all_test_files)
+    test_row = {tf: i for i, tf in enumerate(all_test_files)}
+    rows_of: Dict[str, List[int]] = {
+        sf: [test_row[tf] for tf in find_test_files(sf)]
+        for sf in set().union(*smell_files_by_type.values())
+    }
+
+    presence_rows = np.zeros((len(smell_files_by_type), len(all_test_files)))
+    for row, smell_files in enumerate(smell_files_by_type.values()):
+        for sf in smell_files:
+            presence_rows[row, rows_of[sf]] = 1.0
+
+    rho_matrix, p_matrix = _spearman_matrix(presence_rows, metric_rows)
 
     results: Dict[str, Dict] = {}
 
-    for smell_type, instances in smells_by_type.items():
+    for row, (smell_type, instances) in enumerate(smells_by_type.items()):
         abbr = SMELL_ABBREVIATIONS.get(smell_type, smell_type[:4].upper())
-        smell_files: Set[str] = set(inst['file'] for inst in instances)
-
-        presence: List[float] = [
-            1.0 if any(paths_match(tf, sf) for sf in smell_files) else 0.0
-            for tf in all_test_files
-        ]
+        smell_files = smell_files_by_type[smell_type]
 
-        rho_cf, p_cf = _spearman(presence, chg_freq_col)
-        rho_ce, p_ce = _spearman(presence, chg_ext_col)
-        rho_ff, p_ff = _spearman(presence, fault_freq_col)
-        rho_fe, p_fe = _spearman(presence, fault_ext_col)
+        rho_cf, rho_ce, rho_ff, rho_fe = (float(v) for v in rho_matrix[row])
+        p_cf, p_ce, p_ff, p_fe = (float(v) for v in p_matrix[row])
 
         cp_score = rho_cf + rho_ce
         fp_score = rho_ff + rho_fe
@@ -461,26 +661,38 @@ def analyze_project_with_git(
     print(f"  Analyzing: {project_path.name}")
     print(f"{'='*60}")
 
-    commits = extract_git_history(project_path)
-    if not commits:
+    try:
+        history = _aggregate_history(iter_git_history(project_path))
+    except GitHistoryError as exc:
+        print(f"[ERROR] {exc}")
+        history = None
+    except Exception as exc:
+        print(f"[ERROR] git history: {exc}")
+        history = None
+
+    if history is None or not history.total_commits:
         return {'error': 'No git history found or not a git repository.', 'metrics': {}}
 
-    total_commits  = len(commits)
-    faulty_commits = [c for c in commits if c['is_faulty']]
+    total_commits  = history.total_commits
+    faulty_commits = history.faulty_commits
 
+    print(f"[GIT] Extracted {total_commits} commits from {project_path.name}")
     print(f"[GIT] Total commits : {total_commits}")
-    print(f"[GIT] Faulty commits: {len(faulty_commits)} "
-          f"({100*len(faulty_commits)/total_commits:.1f}%)")
+    print(f"[GIT] Faulty commits: {faulty_commits} "
+          f"({100*faulty_commits/total_commits:.1f}%)")
 
-    file_metrics       = _build_file_metrics(commits)
-    all_git_test_files = sorted(f for f in file_metrics if is_test_file(f))
-    all_git_prod_files = sorted(f for f in file_metrics if is_production_file(f))
+    # Only the union with the smell files below needs ordering; production
+    # files are just counted
+    git_test_files = {
+        f for f, k in zip(history.file_ids, history.file_kinds) if k == _TEST_FILE
+    }
+    n_git_prod_files = int(np.count_nonzero(history.file_kinds == _PROD_FILE))
 
-    print(f"[GIT] Test files in history  : {len(all_git_test_files)}")
-    print(f"[GIT] Prod files in history  : {len(all_git_prod_files)}")
+    print(f"[GIT] Test files in history  : {len(git_test_files)}")
+    print(f"[GIT] Prod files in history  : {n_git_prod_files}")
 
     smell_test_files: Set[str] = set(inst['file'] for inst in smell_instances)
-    all_test_files: List[str]  = sorted(smell_test_files | set(all_git_test_files))
+    all_test_files: List[str]  = sorted(smell_test_files | git_test_files)
 
     print(f"[SMELL] Test files with smells: {len(smell_test_files)}")
     print(f"[TOTAL] Test file population  : {len(all_test_files)}")
@@ -489,15 +701,13 @@ def analyze_project_with_git(
         return {'error': 'No test files found in git history or smell instances.', 'metrics': {}}
 
     print("\n[STEP 4] Building co-change map...")
-    cochange_map = _build_cochange_map(all_test_files, commits)
-    mapped = sum(1 for v in cochange_map.values() if v)
+    cochange_map = _build_cochange_map(all_test_files, history)
+    mapped = int(np.count_nonzero(np.diff(cochange_map[0])))
     print(f"[COCHANGE] {mapped}/{len(all_test_files)} test files "
           f"have co-changed production files")
 
     print("\n[STEP 5] Computing combined metric vectors...")
-    combined_vectors = _build_combined_vectors(
-        all_test_files, file_metrics, cochange_map, total_commits
-    )
+    combined_vectors = _build_combined_vectors(all_test_files, history, cochange_map)
 
     print("\n[STEP 6] Computing Spearman correlations (CP / FP / PS)...")
     metrics = calculate_spearman_metrics(smell_instances, combined_vectors, all_test_files)
@@ -523,10 +733,10 @@ def analyze_project_with_git(
 
     statistics = {
         'total_commits':         total_commits,
-        'faulty_commits':        len(faulty_commits),
-        'fault_commit_pct':      round(100 * len(faulty_commits) / total_commits, 2),
+        'faulty_commits':        faulty_commits,
+        'fault_commit_pct':      round(100 * faulty_commits / total_commits, 2),
         'total_test_files':      len(all_test_files),
-        'total_prod_files':      len(all_git_prod_files),
+        'total_prod_files':      n_git_prod_files,
         'smell_types_analyzed':  len(metrics),
         'total_smell_instances': len(smell_instances),
     }
@@ -0,0 +1,102 @@
+"""
+Repository cloning shared by project runs and the GitHub upload route.
+
+git runs as an asyncio subprocess so a clone (network-bound, often minutes)
+never blocks the event loop. Event loops without subprocess support (the
+Windows selector loop uvicorn uses under --reload) run it in a worker
+thread instead.
+"""
+
+import asyncio
+import logging
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CLONE_TIMEOUT = 300
+
+
+class GitCloneError(RuntimeError):
+    """git clone exited non-zero; the message is git's stderr."""
+
+
+class GitCloneTimeout(GitCloneError):
+    """git clone did not finish within the timeout and was killed."""
+
+
+async def clone_repository(
+    repo_url: str,
+    dest: Path,
+    timeout: int = CLONE_TIMEOUT,
+    depth: Optional[int] = None,
+) -> None:
+    """
+    Clone repo_url into dest.
+
+    Git metrics walk the full history of HEAD, so the clone keeps every
+    commit (unless a depth is given or configured via GIT_CLONE_DEPTH) but
+    skips other branches and tags.
+    """
+    if depth is None:
+        depth = settings.git_clone_depth
+
+    args = ["git", "clone", "--single-branch", "--no-tags"]
+    if depth:
+        args.append(f"--depth={depth}")
+    args += [repo_url, str(dest)]
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except NotImplementedError:
+        await asyncio.to_thread(_clone_blocking, args, timeout)
+        return
+
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise GitCloneTimeout(f"git clone timed out after {timeout} seconds")
+
+    if proc.returncode != 0:
+        raise GitCloneError(stderr.decode(errors="replace"))
+
+
+def _clone_blocking(args: list, timeout: int) -> None:
+    """Same as clone_repository's subprocess path, for loops that lack one."""
+    try:
+        result = subprocess.run(args, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise GitCloneTimeout(f"git clone timed out after {timeout} seconds")
+
+    if result.returncode != 0:
+        raise GitCloneError(result.stderr.decode(errors="replace"))
+
+
+def get_head_sha(repo_path: Path) -> Optional[str]:
+    """
+    Return the commit SHA of HEAD, or None if it can't be resolved.
+    Identifies the analysed snapshot for caching.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+    except Exception as exc:
+        logger.warning("get_head_sha error: %s", exc)
+        return None
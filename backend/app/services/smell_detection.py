@@ -24,8 +24,44 @@ The 15 smells:
 """
 
 import ast
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from itertools import repeat
 from pathlib import Path
-from .git_metrics import analyze_project_with_git
+from typing import List, NamedTuple, Optional
+from app.core.config import settings
+from app.utils.process_pool import pool_map
+from .git_metrics import GIT_METRICS_VERSION, analyze_project_with_git
+
+# Up to this many test files are parsed in-process; the pool round-trip
+# outweighs the parallelism for tiny projects
+_SEQUENTIAL_MAX_FILES = 4
+# Files handed to a worker per task, to amortise pickling round-trips
+_DETECT_CHUNKSIZE = 16
+
+# Part of every result-cache key: bump whenever a detector's output changes
+# so results cached by older code are never served
+_DETECTOR_VERSION = b"3"
+# Stored on each run: a later run of the same commit only reuses its
+# analysis when this matches, so detector or metric changes take effect
+ANALYSIS_VERSION = f"{_DETECTOR_VERSION.decode()}.{GIT_METRICS_VERSION}"
+# Results kept in memory per process, so files copied under several paths
+# are analysed once even with the disk cache disabled
+_MEMO_MAX_ENTRIES = 2000
+
+
+class Smell(NamedTuple):
+    """One detected smell; detectors build these, results expose them as dicts."""
+    type: str
+    line: int
+    message: str
+
+# Fixture methods whose assignments General Fixture counts
+_SETUP_METHOD_NAMES = frozenset({"setUp", "setup", "setup_method", "setUpClass"})
+# Except clauses catching one of these count as generic (EH)
+_GENERIC_EXCEPTIONS = frozenset({"Exception", "BaseException"})
 
 
 # =====================================================
@@ -37,10 +73,7 @@ def detect_smells_for_project(project_path: Path, include_git_metrics: bool = Tr
     Detect all 15 paper-defined test smells across a project's test files.
     Optionally computes CP/FP/PS metrics from git history.
     """
-    test_files = (
-        list(project_path.glob("**/test_*.py")) +
-        list(project_path.glob("**/*_test.py"))
-    )
+    test_files = list(_iter_test_files(project_path))
 
     if not test_files:
         return {
@@ -50,26 +83,20 @@ def detect_smells_for_project(project_path: Path, include_git_metrics: bool = Tr
             "git_metrics": None,
         }
 
-    results = []
-    total_smells = 0
-    all_smell_instances = []
-
-    for file in test_files:
-        rel_path = str(file.relative_to(project_path))
-
-        file_smells = detect_all_smells(file)
-        total_smells += len(file_smells)
-
-        for smell in file_smells:
-            instance = smell.copy()
-            instance['file'] = rel_path
-            all_smell_instances.append(instance)
+    # AST parsing and the detectors are pure CPU and independent per file
+    if len(test_files) <= _SEQUENTIAL_MAX_FILES or (os.cpu_count() or 1) < 2:
+        results = [_detect_one(file, project_path) for file in test_files]
+    else:
+        results = pool_map(
+            _detect_one, test_files, repeat(project_path),
+            chunksize=_DETECT_CHUNKSIZE,
+        )
 
-        results.append({
-            "file":        rel_path,
-            "smells":      file_smells,
-            "smell_count": len(file_smells),
-        })
+    total_smells = sum(r["smell_count"] for r in results)
+    all_smell_instances = []
+    for r in results:
+        r["smells"] = [smell._asdict() for smell in r["smells"]]
+        all_smell_instances.extend({**smell, 'file': r["file"]} for smell in r["smells"])
 
     # Git-based metrics (CP / FP / PS)
     git_analysis = None
@@ -88,31 +115,93 @@ def detect_smells_for_project(project_path: Path, include_git_metrics: bool = Tr
     }
 
 
+def _detect_one(test_file: Path, project_path: Path) -> dict:
+    """
+    Per-file entry of the "details" list (runs in a pool worker); smells
+    stay Smell tuples, which pickle smaller, until the caller converts them.
+    """
+    smells = detect_all_smells(test_file)
+    return {
+        "file":        str(test_file.relative_to(project_path)),
+        "smells":      smells,
+        "smell_count": len(smells),
+    }
+
+
+def _is_test_filename(name: str) -> bool:
+    return name.endswith('.py') and (name.startswith('test_') or name.endswith('_test.py'))
+
+
+def _iter_test_files(root: Path):
+    """
+    Yield test_*.py / *_test.py files under root in one os.scandir walk
+    (a directory's matches, then its subdirectories depth-first).
+    Hidden directories (.git, .venv, ...) and __pycache__ are not entered,
+    and directory symlinks are not followed.
+    """
+    subdirs = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            name = entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not name.startswith('.') and name != '__pycache__':
+                    subdirs.append(entry.path)
+            elif _is_test_filename(name) and entry.is_file():
+                yield Path(entry.path)
+    for subdir in subdirs:
+        yield from _iter_test_files(Path(subdir))
+
+
 # =====================================================
 # TOP-LEVEL DISPATCHER
 # =====================================================
 
-def detect_all_smells(test_file: Path):
+def detect_all_smells(test_file: Path) -> List[Smell]:
     """
     Run all 15 smell detectors on a single test file.
-    Returns a flat list of smell dicts:
-      { 'type': str, 'line': int, 'message': str }
+    Returns a flat list of Smell(type, line, message) tuples.
     """
     smells = []
 
     try:
-        source = test_file.read_text(encoding="utf-8")
-        tree   = ast.parse(source)
-        lines  = source.splitlines()
-
-        class_nodes    = [n for n in ast.walk(tree) if isinstance(n, ast.ClassDef)]
-        function_nodes = [n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef)]
+        source = test_file.read_bytes()
+        digest = _source_digest(source)
+        cached = _memo.get(digest)
+        if cached is not None:
+            _memo.move_to_end(digest)
+            return list(cached)
+        cache_path = _cache_path(digest)
+        cached = _load_cached(cache_path)
+        if cached is not None:
+            _remember(digest, cached)
+            return list(cached)
+
+        # Parse the raw bytes: no separate decode pass, and the parser honours
+        # PEP 263 coding cookies and a UTF-8 BOM
+        tree = ast.parse(source, filename=str(test_file))
+
+        # One traversal, binning classes and test functions (each keeps walk
+        # order); helpers are dropped here, the function detectors only
+        # report on test_* functions
+        class_nodes    = []
+        function_nodes = []
+        for node in ast.walk(tree):
+            node_type = type(node)
+            if node_type is ast.FunctionDef:
+                if node.name.startswith('test_'):
+                    function_nodes.append(node)
+            elif node_type is ast.ClassDef:
+                class_nodes.append(node)
 
         for class_node in class_nodes:
             smells.extend(_analyze_class_smells(class_node))
 
         for func_node in function_nodes:
-            smells.extend(_analyze_function_smells(func_node, lines))
+            smells.extend(_analyze_function_smells(func_node))
+
+        _store_cached(cache_path, smells)
+        _remember(digest, smells)
+        smells = list(smells)
 
     except Exception as exc:
         print(f"Error analyzing {test_file}: {exc}")
@@ -120,6 +209,57 @@ def detect_all_smells(test_file: Path):
     return smells
 
 
+# =====================================================
+# RESULT CACHE (keyed by file content)
+# =====================================================
+# Projects are re-cloned / re-extracted on every run, so paths and mtimes
+# never repeat, but most test files' bytes do. Detection results are cached
+# on disk (shared by the pool workers) under a blake2b of the source; JSON
+# rather than pickled ASTs, since loading a tree costs about as much as
+# parsing it and pickle is unsafe to read back from a shared directory.
+# Cache I/O is best-effort: any failure just means re-detecting. In front
+# of it sits a small in-process LRU (read-only lists, callers get copies).
+
+_memo: "OrderedDict[str, List[Smell]]" = OrderedDict()
+
+
+def _source_digest(source: bytes) -> str:
+    return hashlib.blake2b(_DETECTOR_VERSION + b"\0" + source, digest_size=20).hexdigest()
+
+
+def _remember(digest: str, smells: List[Smell]) -> None:
+    _memo[digest] = smells
+    if len(_memo) > _MEMO_MAX_ENTRIES:
+        _memo.popitem(last=False)
+
+
+def _cache_path(digest: str) -> Optional[Path]:
+    if not settings.smell_cache_dir:
+        return None
+    return Path(settings.smell_cache_dir).expanduser() / "smells" / digest[:2] / f"{digest}.json"
+
+
+def _load_cached(cache_path: Optional[Path]) -> Optional[List[Smell]]:
+    if cache_path is None:
+        return None
+    try:
+        return [Smell(*smell) for smell in json.loads(cache_path.read_bytes())]
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _store_cached(cache_path: Optional[Path], smells: List[Smell]) -> None:
+    if cache_path is None:
+        return
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(smells), encoding="utf-8")
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass
+
+
 # =====================================================
 # CLASS-LEVEL SMELLS
 # =====================================================
@@ -134,49 +274,57 @@ def _analyze_class_smells(class_node: ast.ClassDef):
     """
     smells = []
 
-    all_methods  = [n for n in class_node.body if isinstance(n, ast.FunctionDef)]
-    test_methods = [m for m in all_methods if m.name.startswith('test_')]
+    # One pass over the class body indexes the methods every check needs
+    test_methods  = []
+    setup_methods = []
+    has_init      = False
+    for node in class_node.body:
+        if isinstance(node, ast.FunctionDef):
+            if node.name.startswith('test_'):
+                test_methods.append(node)
+            elif node.name in _SETUP_METHOD_NAMES:
+                setup_methods.append(node)
+            elif node.name == '__init__':
+                has_init = True
 
     # ── CI: Constructor Initialization ──────────────────────────────
     # Test class uses __init__ instead of setUp()
-    if any(m.name == '__init__' for m in all_methods):
-        smells.append({
-            "type":    "Constructor Initialization",
-            "line":    class_node.lineno,
-            "message": "__init__ used in test class instead of setUp()",
-        })
+    if has_init:
+        smells.append(Smell(
+            type="Constructor Initialization",
+            line=class_node.lineno,
+            message="__init__ used in test class instead of setUp()",
+        ))
 
     # ── GF: General Fixture ─────────────────────────────────────────
     # setUp() initialises more objects than any single test needs
-    setup_methods = [
-        m for m in all_methods
-        if m.name in ('setUp', 'setup', 'setup_method', 'setUpClass')
-    ]
     for setup in setup_methods:
         assignments = [n for n in ast.walk(setup) if isinstance(n, ast.Assign)]
         if len(assignments) > 5:
-            smells.append({
-                "type":    "General Fixture",
-                "line":    setup.lineno,
-                "message": (
+            smells.append(Smell(
+                type="General Fixture",
+                line=setup.lineno,
+                message=(
                     f"setUp() contains {len(assignments)} assignments — "
                     "likely initialises more than any single test needs"
                 ),
-            })
+            ))
 
     # ── TM: Test Maverick ───────────────────────────────────────────
     # Test class with only one test method (isolated, non-cohesive)
     if len(test_methods) == 1:
-        smells.append({
-            "type":    "Test Maverick",
-            "line":    class_node.lineno,
-            "message": "Test class contains only one test method",
-        })
+        smells.append(Smell(
+            type="Test Maverick",
+            line=class_node.lineno,
+            message="Test class contains only one test method",
+        ))
 
     # ── LCTC: Lack of Cohesion of Test Cases ────────────────────────
     # Test methods share no common self.* attributes → unrelated concerns
     if len(test_methods) > 1:
-        attr_sets = []
+        # Only flag when methods actually USE self.* but share nothing:
+        # intersect as we go and stop at the first method using none
+        common = None
         for method in test_methods:
             attrs = {
                 n.attr
@@ -185,18 +333,17 @@ def _analyze_class_smells(class_node: ast.ClassDef):
                 and isinstance(n.value, ast.Name)
                 and n.value.id == 'self'
             }
-            attr_sets.append(attrs)
-
-        # Only flag when methods actually USE self.* but share nothing
-        non_empty = [s for s in attr_sets if s]
-        if len(non_empty) == len(attr_sets) and len(attr_sets) > 1:
-            common = set.intersection(*attr_sets)
-            if not common:
-                smells.append({
-                    "type":    "Lack of Cohesion of Test Cases",
-                    "line":    class_node.lineno,
-                    "message": "Test methods share no common self.* attributes",
-                })
+            if not attrs:
+                common = None
+                break
+            common = attrs if common is None else common & attrs
+
+        if common is not None and not common:
+            smells.append(Smell(
+                type="Lack of Cohesion of Test Cases",
+                line=class_node.lineno,
+                message="Test methods share no common self.* attributes",
+            ))
 
     return smells
 
@@ -205,7 +352,7 @@ def _analyze_class_smells(class_node: ast.ClassDef):
 # FUNCTION-LEVEL SMELLS
 # =====================================================
 
-def _analyze_function_smells(func_node: ast.FunctionDef, lines: list):
+def _analyze_function_smells(func_node: ast.FunctionDef):
     """
     Detects function-level smells:
       ET  - Empty Test
@@ -227,44 +374,78 @@ def _analyze_function_smells(func_node: ast.FunctionDef, lines: list):
         return smells
 
     body_nodes = func_node.body
-    all_nodes  = list(ast.walk(func_node))
 
     # ── ET: Empty Test ───────────────────────────────────────────────
     if not body_nodes or (
         len(body_nodes) == 1 and isinstance(body_nodes[0], ast.Pass)
     ):
-        smells.append({
-            "type":    "Empty Test",
-            "line":    func_node.lineno,
-            "message": "Test has no body or contains only 'pass'",
-        })
+        smells.append(Smell(
+            type="Empty Test",
+            line=func_node.lineno,
+            message="Test has no body or contains only 'pass'",
+        ))
         return smells   # nothing else to check
 
     # Also treat a docstring-only body as empty
     if len(body_nodes) == 1 and isinstance(body_nodes[0], ast.Expr) and isinstance(body_nodes[0].value, ast.Constant):
-        smells.append({
-            "type":    "Empty Test",
-            "line":    func_node.lineno,
-            "message": "Test contains only a docstring — no assertions",
-        })
+        smells.append(Smell(
+            type="Empty Test",
+            line=func_node.lineno,
+            message="Test contains only a docstring — no assertions",
+        ))
         return smells
 
-    # Collect assertions once — reused by multiple detectors below
-    assertions = [n for n in all_nodes if isinstance(n, ast.Assert)]
+    # One pass over the function's nodes (ast.walk order), collecting what
+    # each detector below needs; "first" means first in walk order
+    assertions   = []
+    assign_lines = []           # OS
+    ctor_lines   = []           # OS: Capitalised(...) calls
+    first_if     = None         # CTL
+    first_loop   = None         # CTL
+    try_nodes    = []           # EH
+    first_sleep  = None         # ST
+    print_lines  = []           # RP
+
+    for node in ast.walk(func_node):
+        node_type = type(node)
+        if node_type is ast.Call:
+            func = node.func
+            func_type = type(func)
+            if func_type is ast.Name:
+                if func.id == 'print':
+                    print_lines.append(node.lineno)
+                # Heuristic: capitalised name → likely a constructor call
+                if func.id and func.id[0].isupper():
+                    ctor_lines.append(node.lineno)
+            elif func_type is ast.Attribute:
+                if first_sleep is None and func.attr == 'sleep':
+                    first_sleep = node
+        elif node_type is ast.Assert:
+            assertions.append(node)
+        elif node_type is ast.Assign:
+            assign_lines.append(node.lineno)
+        elif node_type is ast.If:
+            if first_if is None:
+                first_if = node
+        elif node_type is ast.For or node_type is ast.While:
+            if first_loop is None:
+                first_loop = node
+        elif node_type is ast.Try:
+            try_nodes.append(node)
 
     # ── AR: Assertion Roulette ───────────────────────────────────────
     # Multiple assertions with no explanatory message
     if len(assertions) > 3:
         no_msg = [a for a in assertions if a.msg is None]
         if len(no_msg) > 3:
-            smells.append({
-                "type":    "Assertion Roulette",
-                "line":    func_node.lineno,
-                "message": (
+            smells.append(Smell(
+                type="Assertion Roulette",
+                line=func_node.lineno,
+                message=(
                     f"{len(no_msg)} assertions have no failure message — "
                     "hard to identify which one fails"
                 ),
-            })
+            ))
 
     # ── RA: Redundant Assertion ──────────────────────────────────────
     # assert True  /  assert 1 == 1  — always passes, zero value
@@ -282,11 +463,11 @@ def _analyze_function_smells(func_node: ast.FunctionDef, lines: list):
             node.test.left.value == node.test.comparators[0].value
         )
         if is_trivially_true or is_tautology:
-            smells.append({
-                "type":    "Redundant Assertion",
-                "line":    node.lineno,
-                "message": "Assertion always passes — provides no real verification",
-            })
+            smells.append(Smell(
+                type="Redundant Assertion",
+                line=node.lineno,
+                message="Assertion always passes — provides no real verification",
+            ))
 
     # ── SA: Suboptimal Assert ────────────────────────────────────────
     # assertTrue(x == y) / assertTrue(x is True) instead of assertEqual
@@ -297,14 +478,14 @@ def _analyze_function_smells(func_node: ast.FunctionDef, lines: list):
                     isinstance(comparator, ast.Constant) and
                     comparator.value in (True, False)
                 ):
-                    smells.append({
-                        "type":    "Suboptimal Assert",
-                        "line":    node.lineno,
-                        "message": (
+                    smells.append(Smell(
+                        type="Suboptimal Assert",
+                        line=node.lineno,
+                        message=(
                             "Comparing with True/False explicitly — "
                             "use assertTrue()/assertFalse() instead"
                         ),
-                    })
+                    ))
                     break
 
     # ── DA: Duplicate Assert ─────────────────────────────────────────
@@ -312,18 +493,19 @@ def _analyze_function_smells(func_node: ast.FunctionDef, lines: list):
     seen_assertions: dict = {}
     for node in assertions:
         try:
-            text = ast.unparse(node.test)
-            if text in seen_assertions:
-                smells.append({
-                    "type":    "Duplicate Assert",
-                    "line":    node.lineno,
-                    "message": (
+            key = _structure_key(node.test)
+            if key in seen_assertions:
+                text = ast.unparse(node.test)
+                smells.append(Smell(
+                    type="Duplicate Assert",
+                    line=node.lineno,
+                    message=(
                         f"Assertion '{text}' duplicates line "
-                        f"{seen_assertions[text]}"
+                        f"{seen_assertions[key]}"
                     ),
-                })
+                ))
             else:
-                seen_assertions[text] = node.lineno
+                seen_assertions[key] = node.lineno
         except Exception:
             pass
 
@@ -337,120 +519,108 @@ def _analyze_function_smells(func_node: ast.FunctionDef, lines: list):
                     isinstance(comp.value, (int, float)) and
                     comp.value not in (0, 1, -1, 0.0, 1.0, -1.0)
                 ):
-                    smells.append({
-                        "type":    "Magic Number Test",
-                        "line":    node.lineno,
-                        "message": (
+                    smells.append(Smell(
+                        type="Magic Number Test",
+                        line=node.lineno,
+                        message=(
                             f"Magic number {comp.value!r} in assertion — "
                             "use a named constant"
                         ),
-                    })
+                    ))
                     break   # one report per assertion is enough
 
     # ── OS: Obscure In-Line Setup ────────────────────────────────────
     # Significant object creation / variable assignment happens inside
     # the test body rather than in setUp(), obscuring the test's intent.
     # Heuristic: ≥ 3 assignments OR ≥ 2 constructor calls before any assertion.
-    setup_assignments = 0
-    constructor_calls = 0
     first_assert_line = min((a.lineno for a in assertions), default=None)
-
-    for node in all_nodes:
-        node_line = getattr(node, 'lineno', None)
-        if first_assert_line and node_line and node_line >= first_assert_line:
-            continue    # only count nodes BEFORE the first assertion
-        if isinstance(node, ast.Assign):
-            setup_assignments += 1
-        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
-            # Heuristic: capitalised name → likely a constructor call
-            if node.func.id and node.func.id[0].isupper():
-                constructor_calls += 1
+    if first_assert_line:
+        # only count nodes BEFORE the first assertion
+        setup_assignments = sum(1 for line in assign_lines if line < first_assert_line)
+        constructor_calls = sum(1 for line in ctor_lines if line < first_assert_line)
+    else:
+        setup_assignments = len(assign_lines)
+        constructor_calls = len(ctor_lines)
 
     if setup_assignments >= 3 or constructor_calls >= 2:
-        smells.append({
-            "type":    "Obscure In-Line Setup",
-            "line":    func_node.lineno,
-            "message": (
+        smells.append(Smell(
+            type="Obscure In-Line Setup",
+            line=func_node.lineno,
+            message=(
                 f"Test body contains {setup_assignments} assignments and "
                 f"{constructor_calls} constructor calls before first assertion — "
                 "move setup to setUp()"
             ),
-        })
+        ))
 
     # ── CTL: Conditional Test Logic ──────────────────────────────────
     # if / for / while inside test method introduces multiple execution paths
-    for node in all_nodes:
-        if isinstance(node, ast.If):
-            smells.append({
-                "type":    "Conditional Test Logic",
-                "line":    node.lineno,
-                "message": "Test contains an if/else branch",
-            })
-            break   # one report per function
-    for node in all_nodes:
-        if isinstance(node, (ast.For, ast.While)):
-            smells.append({
-                "type":    "Conditional Test Logic",
-                "line":    node.lineno,
-                "message": "Test contains a loop (for/while)",
-            })
-            break
+    if first_if is not None:
+        smells.append(Smell(
+            type="Conditional Test Logic",
+            line=first_if.lineno,
+            message="Test contains an if/else branch",
+        ))
+    if first_loop is not None:
+        smells.append(Smell(
+            type="Conditional Test Logic",
+            line=first_loop.lineno,
+            message="Test contains a loop (for/while)",
+        ))
 
     # ── EH: Exception Handling ──────────────────────────────────────
     # try/except in test instead of using assertRaises()
-    for node in all_nodes:
-        if isinstance(node, ast.Try):
-            for handler in node.handlers:
-                is_generic = (
-                    handler.type is None or
-                    (isinstance(handler.type, ast.Name) and
-                     handler.type.id == 'Exception')
-                )
-                if is_generic:
-                    smells.append({
-                        "type":    "Exception Handling",
-                        "line":    node.lineno,
-                        "message": (
-                            "Generic try/except in test — "
-                            "use assertRaises() instead"
-                        ),
-                    })
-                    break   # one report per try block
+    for node in try_nodes:
+        for handler in node.handlers:
+            is_generic = (
+                handler.type is None or
+                (type(handler.type) is ast.Name and
+                 handler.type.id in _GENERIC_EXCEPTIONS)
+            )
+            if is_generic:
+                smells.append(Smell(
+                    type="Exception Handling",
+                    line=node.lineno,
+                    message=(
+                        "Generic try/except in test — "
+                        "use assertRaises() instead"
+                    ),
+                ))
+                break   # one report per try block
 
     # ── ST: Sleepy Test ──────────────────────────────────────────────
     # time.sleep() call makes tests slow and non-deterministic
-    for node in all_nodes:
-        if (
-            isinstance(node, ast.Call) and
-            isinstance(node.func, ast.Attribute) and
-            node.func.attr == 'sleep'
-        ):
-            smells.append({
-                "type":    "Sleepy Test",
-                "line":    node.lineno,
-                "message": "Test uses time.sleep() — non-deterministic across machines",
-            })
-            break   # one report per function
+    if first_sleep is not None:
+        smells.append(Smell(
+            type="Sleepy Test",
+            line=first_sleep.lineno,
+            message="Test uses time.sleep() — non-deterministic across machines",
+        ))
 
     # ── RP: Redundant Print ──────────────────────────────────────────
     # print() calls inside test add noise, serve no assertion purpose
-    print_lines = [
-        node.lineno
-        for node in all_nodes
-        if (
-            isinstance(node, ast.Call) and
-            isinstance(node.func, ast.Name) and
-            node.func.id == 'print'
-        )
-    ]
     if print_lines:
-        smells.append({
-            "type":    "Redundant Print",
-            "line":    print_lines[0],
-            "message": (
+        smells.append(Smell(
+            type="Redundant Print",
+            line=print_lines[0],
+            message=(
                 f"Test contains {len(print_lines)} print statement(s) — "
                 "remove or replace with logging"
             ),
-        })
+        ))
 
-    return smells
\ No newline at end of file
+    return smells
+
+
+def _structure_key(node):
+    """
+    Hashable key that is equal for two expressions exactly when they are
+    the same code (what comparing ast.unparse() text tested), without
+    building source strings. Every field counts, positions don't; constants
+    carry their type so 1, 1.0 and True stay distinct.
+    """
+    if isinstance(node, ast.AST):
+        return (type(node), *(_structure_key(getattr(node, f, None)) for f in node._fields))
+    if isinstance(node, list):
+        return (list, *(_structure_key(item) for item in node))
+    return (type(node), node)
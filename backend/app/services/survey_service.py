@@ -3,11 +3,12 @@ Developer Survey Module — survey_service.py
 
 Handles:
   1. Contributor email extraction from git history
-  2. Survey email dispatch via Gmail SMTP (fastapi-mail)
+  2. Survey email dispatch via Resend or Gmail SMTP (aiosmtplib)
   3. DDS calculation (rolling avg after each submission)
   4. Quadrant classification: PS × DDS → Technical Debt Quadrant
 """
 
+import logging
 import subprocess
 import uuid
 from pathlib import Path
@@ -16,6 +17,8 @@ from collections import defaultdict
 
 from app.services.git_metrics import SMELL_ABBREVIATIONS
 
+logger = logging.getLogger(__name__)
+
 # ── Canonical 15 smells (abbr → full name) ──────────────────────────
 ABBR_TO_NAME: Dict[str, str] = {v: k for k, v in SMELL_ABBREVIATIONS.items()}
 
@@ -67,14 +70,16 @@ _BOT_PATTERNS = [
 
 def extract_contributors(repo_path: Path) -> List[Dict[str, str]]:
     """
-    Run `git log` to get all unique contributor names + emails.
+    Run `git shortlog` to get all unique contributor names + emails.
+    git aggregates authors itself, so Python only sees one line per
+    author identity (most active first) instead of one per commit.
     Filters out bots and noreply addresses.
 
     Returns: [{"name": str, "email": str}, ...]
     """
     try:
         result = subprocess.run(
-            ["git", "log", "--format=%an|%ae", "--no-merges"],
+            ["git", "shortlog", "-sne", "--no-merges", "HEAD"],
             cwd=repo_path,
             capture_output=True,
             text=True,
@@ -86,13 +91,14 @@ def extract_contributors(repo_path: Path) -> List[Dict[str, str]]:
         seen_emails: set = set()
         contributors: List[Dict[str, str]] = []
 
-        for line in result.stdout.strip().splitlines():
-            line = line.strip()
-            if "|" not in line:
+        # Each line: "<count>\t<name> <<email>>"
+        for line in result.stdout.splitlines():
+            _, _, ident = line.partition("\t")
+            name, sep, email = ident.rpartition(" <")
+            if not sep:
                 continue
-            name, email = line.split("|", 1)
             name  = name.strip()
-            email = email.strip().lower()
+            email = email.rstrip(">").strip().lower()
 
             if not email or "@" not in email:
                 continue
@@ -107,7 +113,7 @@ def extract_contributors(repo_path: Path) -> List[Dict[str, str]]:
         return contributors
 
     except Exception as exc:
-        print(f"[SURVEY] extract_contributors error: {exc}")
+        logger.warning("extract_contributors error: %s", exc)
         return []
 
 
@@ -162,72 +168,78 @@ async def _send_via_resend(contributors, base_url, project_name, settings):
                     "html": html_body,
                 })
                 sent += 1
-                print(f"[SURVEY] Resend: email sent to {contributor['email']}")
+                logger.info("Resend: email sent to %s", contributor["email"])
             except Exception as e:
-                print(f"[SURVEY] Resend: failed to send to {contributor['email']}: {e}")
+                logger.warning("Resend: failed to send to %s: %s", contributor["email"], e)
                 failed += 1
 
         return {"sent": sent, "failed": failed}
     except ImportError:
-        print("[SURVEY] resend package not installed")
+        logger.warning("resend package not installed")
         return {"sent": 0, "failed": len(contributors), "skipped": True}
 
 
 async def _send_via_smtp(contributors, base_url, project_name, settings):
-    """Send emails via Gmail SMTP (local dev only — blocked on Render free tier)."""
+    """
+    Send emails via Gmail SMTP (local dev only — blocked on Render free tier).
+    One connection (STARTTLS + login) is reused for every recipient.
+    """
+    sent = 0
+    failed = 0
     try:
-        from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+        import aiosmtplib
+        from email.message import EmailMessage
 
         if not settings.mail_username or not settings.mail_password:
-            print("[SURVEY] Email credentials not configured — skipping send")
+            logger.warning("Email credentials not configured — skipping send")
             return {"sent": 0, "failed": len(contributors), "skipped": True}
 
-        conf = ConnectionConfig(
-            MAIL_USERNAME=settings.mail_username,
-            MAIL_PASSWORD=settings.mail_password,
-            MAIL_FROM=settings.mail_from or settings.mail_username,
-            MAIL_FROM_NAME=settings.mail_from_name,
-            MAIL_PORT=587,
-            MAIL_SERVER="smtp.gmail.com",
-            MAIL_STARTTLS=True,
-            MAIL_SSL_TLS=False,
-            USE_CREDENTIALS=True,
-            VALIDATE_CERTS=True,
-        )
-
-        fm = FastMail(conf)
-        sent = 0
-        failed = 0
+        from_address = f"{settings.mail_from_name} <{settings.mail_from or settings.mail_username}>"
 
-        for contributor in contributors:
-            survey_url = f"{base_url}/survey/{contributor['token']}"
-            html_body = _build_email_html(
-                name=contributor["name"],
-                project_name=project_name,
-                survey_url=survey_url,
-            )
-            try:
-                msg = MessageSchema(
-                    subject=f"[Test Smell Rank] Developer Survey — {project_name}",
-                    recipients=[contributor["email"]],
-                    body=html_body,
-                    subtype=MessageType.html,
+        smtp = aiosmtplib.SMTP(
+            hostname="smtp.gmail.com",
+            port=587,
+            start_tls=True,
+            validate_certs=True,
+        )
+        async with smtp:
+            await smtp.login(settings.mail_username, settings.mail_password)
+
+            for contributor in contributors:
+                survey_url = f"{base_url}/survey/{contributor['token']}"
+                msg = EmailMessage()
+                msg["Subject"] = f"[Test Smell Rank] Developer Survey — {project_name}"
+                msg["From"] = from_address
+                msg["To"] = contributor["email"]
+                msg.set_content(
+                    _build_email_html(
+                        name=contributor["name"],
+                        project_name=project_name,
+                        survey_url=survey_url,
+                    ),
+                    subtype="html",
                 )
-                await fm.send_message(msg)
-                sent += 1
-                print(f"[SURVEY] SMTP: email sent to {contributor['email']}")
-            except Exception as e:
-                print(f"[SURVEY] SMTP: failed to send to {contributor['email']}: {e}")
-                failed += 1
+                try:
+                    await smtp.send_message(msg)
+                    sent += 1
+                    logger.info("SMTP: email sent to %s", contributor["email"])
+                except aiosmtplib.SMTPServerDisconnected as e:
+                    # The shared session is gone; the remaining sends would all fail
+                    logger.warning("SMTP: connection lost at %s: %s", contributor["email"], e)
+                    failed += len(contributors) - sent - failed
+                    break
+                except Exception as e:
+                    logger.warning("SMTP: failed to send to %s: %s", contributor["email"], e)
+                    failed += 1
 
         return {"sent": sent, "failed": failed}
 
     except ImportError:
-        print("[SURVEY] fastapi-mail not installed — skipping email send")
+        logger.warning("aiosmtplib not installed — skipping email send")
         return {"sent": 0, "failed": len(contributors), "skipped": True}
     except Exception as exc:
-        print(f"[SURVEY] send_survey_emails error: {exc}")
-        return {"sent": 0, "failed": len(contributors)}
+        logger.exception("send_survey_emails error: %s", exc)
+        return {"sent": sent, "failed": len(contributors) - sent}
 
 
 def _build_email_html(name: str, project_name: str, survey_url: str) -> str:
@@ -282,39 +294,56 @@ def _build_email_html(name: str, project_name: str, survey_url: str) -> str:
 # PART 3 — DDS CALCULATION (rolling average)
 # =====================================================
 
-def calculate_dds(responses: List[Dict]) -> Optional[Dict[str, float]]:
+class DDSAccumulator:
     """
-    Compute Developer-Driven Score for each smell from a list of response dicts.
-    Each response has a 'ratings' field: {"CTL": 3, "AR": 5, ...}
-
-    Returns None if no responses yet, otherwise:
-        {"CTL": 2.67, "AR": 1.80, ...}
+    Running per-smell sums/counts, so responses can be folded in one at a
+    time (e.g. straight off a Mongo cursor) without holding them all.
     """
-    if not responses:
-        return None
-
-    sums: Dict[str, float] = defaultdict(float)
-    counts: Dict[str, int] = defaultdict(int)
 
-    for resp in responses:
-        ratings = resp.get("ratings", {})
+    def __init__(self):
+        self.sums: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.responses = 0
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "DDSAccumulator":
+        """Rebuild from the running totals persisted on a survey (see to_state)."""
+        acc = cls()
+        acc.sums.update(state.get("sums") or {})
+        acc.counts.update(state.get("counts") or {})
+        acc.responses = state.get("responses", 0)
+        return acc
+
+    def to_state(self) -> Dict:
+        return {
+            "sums":      dict(self.sums),
+            "counts":    dict(self.counts),
+            "responses": self.responses,
+        }
+
+    def add(self, ratings: Dict) -> None:
+        self.responses += 1
         for abbr in SMELL_ORDER:
             val = ratings.get(abbr)
             if val is not None:
                 try:
-                    sums[abbr] += float(val)
-                    counts[abbr] += 1
+                    self.sums[abbr] += float(val)
+                    self.counts[abbr] += 1
                 except (TypeError, ValueError):
                     pass
 
-    dds: Dict[str, float] = {}
-    for abbr in SMELL_ORDER:
-        if counts[abbr] > 0:
-            dds[abbr] = round(sums[abbr] / counts[abbr], 4)
-        else:
-            dds[abbr] = None   # no ratings received for this smell yet
+    def result(self) -> Optional[Dict[str, float]]:
+        if not self.responses:
+            return None
+
+        dds: Dict[str, float] = {}
+        for abbr in SMELL_ORDER:
+            if self.counts[abbr] > 0:
+                dds[abbr] = round(self.sums[abbr] / self.counts[abbr], 4)
+            else:
+                dds[abbr] = None   # no ratings received for this smell yet
 
-    return dds
+        return dds
 
 
 # =====================================================
@@ -0,0 +1,43 @@
+# app/utils/filesystem.py
+import asyncio
+import os
+import shutil
+import stat
+import uuid
+import weakref
+from pathlib import Path
+
+# Live locks only: an entry disappears once no caller holds its lock
+_directory_locks: "weakref.WeakValueDictionary[Path, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def force_remove(func, path, _excinfo):
+    """Error handler for shutil.rmtree — removes read-only flag on Windows before retrying."""
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
+def remove_tree(path: Path) -> None:
+    shutil.rmtree(path, onerror=force_remove)
+
+
+def move_to_trash(path: Path) -> Path:
+    """
+    Rename path out of the way (a single rename on the same filesystem) and
+    return the new location, so the slow recursive delete can run later
+    without holding up whatever replaces it.
+    """
+    trash = path.parent / f".trash_{uuid.uuid4().hex}"
+    path.rename(trash)
+    return trash
+
+
+def directory_lock(path: Path) -> asyncio.Lock:
+    """
+    Lock for work that replaces the directory at path (trash, clone or
+    extract, analyse), so two requests never rebuild the same checkout at once.
+    """
+    lock = _directory_locks.get(path)
+    if lock is None:
+        lock = _directory_locks[path] = asyncio.Lock()
+    return lock
@@ -0,0 +1,34 @@
+# app/utils/object_ids.py
+from functools import lru_cache
+from typing import Annotated
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import Depends, HTTPException
+
+
+@lru_cache(maxsize=4096)
+def _to_oid(value: str) -> ObjectId:
+    return ObjectId(value)
+
+
+def parse_object_id(value: str, detail: str = "Invalid ID") -> ObjectId:
+    """Parse a path/query id, caching repeat ids (the UI re-requests the same runs)."""
+    try:
+        return _to_oid(value)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail=detail)
+
+
+def project_object_id(project_id: str) -> ObjectId:
+    return parse_object_id(project_id, "Invalid project ID")
+
+
+def run_object_id(run_id: str) -> ObjectId:
+    return parse_object_id(run_id, "Invalid run ID")
+
+
+# Route parameters: `project_oid: ProjectObjectId` reads the {project_id} path
+# segment and hands the handler an ObjectId (400 if malformed)
+ProjectObjectId = Annotated[ObjectId, Depends(project_object_id)]
+RunObjectId = Annotated[ObjectId, Depends(run_object_id)]
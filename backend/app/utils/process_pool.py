@@ -0,0 +1,63 @@
+# app/utils/process_pool.py
+"""
+One process pool shared by every request that spreads CPU work across
+cores (ZIP extraction, smell detection), created on first use.
+
+Workers are never forked from the server process: it runs Motor, the log
+listener and asyncio.to_thread threads, and forking a multi-threaded
+process can deadlock the child. forkserver forks them from a clean
+single-threaded process instead; spawn is the fallback where that is
+unavailable (Windows).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Optional
+
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _start_method() -> str:
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return "forkserver"
+    return "spawn"
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context(_start_method()),
+            )
+        return _pool
+
+
+def pool_map(fn: Callable, *iterables: Iterable, chunksize: int = 1) -> list:
+    """
+    pool.map on the shared pool, collected into a list. A pool broken by a
+    crashed worker is dropped so the next caller gets a fresh one.
+    """
+    global _pool
+    pool = get_process_pool()
+    try:
+        return list(pool.map(fn, *iterables, chunksize=chunksize))
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+def shutdown_process_pool() -> None:
+    """Stop the shared pool's workers (app shutdown)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
@@ -1,12 +1,16 @@
 import os
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.database import client, ensure_indexes
+from app.core.logging_config import start_logging, stop_logging
 from app.routes.auth import router as auth_router
 from app.routes.upload import router as upload_router
-from app.routes.projects import router as projects_router
+from app.routes.projects import router as projects_router, start_run_heartbeat, stop_run_heartbeat
 from app.routes.survey import router as survey_router
+from app.utils.process_pool import shutdown_process_pool
 
-app = FastAPI(title="Test Smell Rank API")
+app = FastAPI(title="Test Smell Rank API", default_response_class=ORJSONResponse)
 
 # Build allowed origins list.
 # ALLOWED_ORIGINS  — comma-separated list (takes priority, most flexible)
@@ -41,6 +45,19 @@ app.include_router(upload_router)
 app.include_router(projects_router)
 app.include_router(survey_router)
 
+@app.on_event("startup")
+async def startup():
+    start_logging()
+    await ensure_indexes()
+    start_run_heartbeat()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_run_heartbeat()
+    client.close()
+    shutdown_process_pool()
+    stop_logging()
+
 @app.get("/")
 async def root():
     return {"message": "Test Smell Rank API is running"}
@@ -25,6 +25,44 @@ const ProjectDetail = () => {
     fetchData();
   }, [projectId]);
 
+  // Runs are analysed in the background — refresh until none are pending
+  const hasPendingRuns = runs.some((r) => r.status === "pending");
+  useEffect(() => {
+    if (!hasPendingRuns) return;
+    const timer = setTimeout(async () => {
+      try {
+        setRuns(await projectsAPI.listRuns(projectId));
+      } catch {
+        // transient network error — schedule another attempt
+        setRuns((prev) => [...prev]);
+      }
+    }, 3000);
+    return () => clearTimeout(timer);
+  }, [hasPendingRuns, runs, projectId]);
+
+  // Survey emails are sent in the background — refresh surveys until dispatch finishes
+  const queuedSurveyRunIds = Object.keys(surveyData).filter(
+    (id) => surveyData[id]?.email_dispatch?.status === "queued"
+  );
+  useEffect(() => {
+    if (queuedSurveyRunIds.length === 0) return;
+    const timer = setTimeout(async () => {
+      const updates = await Promise.all(
+        queuedSurveyRunIds.map((id) =>
+          projectsAPI.getSurveyStatus(projectId, id).catch(() => null)
+        )
+      );
+      setSurveyData((prev) => {
+        const next = { ...prev };
+        queuedSurveyRunIds.forEach((id, i) => {
+          if (updates[i] && updates[i].exists !== false) next[id] = updates[i];
+        });
+        return next;
+      });
+    }, 3000);
+    return () => clearTimeout(timer);
+  }, [surveyData, projectId]);
+
   const fetchData = async () => {
     try {
       setLoading(true);
@@ -220,9 +258,9 @@ const ProjectDetail = () => {
               <button
                 className="run-btn"
                 onClick={handleTriggerRun}
-                disabled={runLoading}
+                disabled={runLoading || hasPendingRuns}
               >
-                {runLoading ? (
+                {runLoading || hasPendingRuns ? (
                   <>
                     <span className="btn-spinner"></span> Analyzing
                   </>
@@ -231,7 +269,7 @@ const ProjectDetail = () => {
                 )}
               </button>
             </div>
-            {runLoading && (
+            {(runLoading || hasPendingRuns) && (
               <div className="run-progress">
                 <div className="spinner"></div>
                 <p>
@@ -520,7 +558,9 @@ const SurveyPanel = ({
                     color: dispatchInfo.skipped ? "#795548" : "#2e7d32",
                   }}
                 >
-                  {dispatchInfo.skipped
+                  {dispatchInfo.status === "queued"
+                    ? "📨 Sending survey emails…"
+                    : dispatchInfo.skipped
                     ? "⚠️ Email credentials not configured — survey links were created but emails were not sent. Configure MAIL_USERNAME / MAIL_PASSWORD in .env to enable sending."
                     : `✅ ${dispatchInfo.sent} email(s) sent · ${dispatchInfo.failed} failed`}
                 </div>